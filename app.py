@@ -1,14 +1,20 @@
 import streamlit as st
-import time
-from utils.speech_processing import record_audio, save_audio, transcribe_audio, synthesize_speech
-from utils.chatbot import get_bot_response
-import pygame
-import threading
 import os
-from dotenv import load_dotenv
-
-# Initialize pygame mixer for better audio playback
-pygame.mixer.init()
+import queue
+import re
+import time
+import uuid
+from utils.speech_processing import record_audio, record_until_silence, encode_audio, synthesize_speech_chunks
+from utils.speech_processing import BargeInMonitor, stream_sentences, synthesize_sentence_stream
+from utils.playback import get_playback_service
+from utils.chatbot import HEDGE_ENABLED, MODELS, response_cache_stats
+from utils.model_router import AUTO_MODEL, get_router
+from utils.chat_view import CHAT_HISTORY_LIMIT, CHAT_WINDOW, ChatView, message_html
+from utils.conversation_store import get_conversation_store
+from utils.memory import ConversationMemory
+from utils.pipeline import get_background_pipeline
+from utils.warmup import STT, TTS, get_warmup_service
+from utils import metrics, resilience
 
 # Set page configuration
 st.set_page_config(
@@ -19,7 +25,7 @@ st.set_page_config(
 )
 
 # Custom CSS with improved styling
-st.markdown("""
+APP_CSS = """
 <style>
     /* Overall app styling */
     .main {
@@ -212,42 +218,103 @@ st.markdown("""
         box-shadow: 0 2px 10px rgba(0,0,0,0.05);
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+
+@st.cache_resource
+def page_style():
+    """
+    APP_CSS minified once per process.
+
+    Streamlit only keeps elements emitted by the current run, so the style
+    block is still sent on every rerun; this keeps it small.
+    """
+    css = re.sub(r"/\*.*?\*/", "", APP_CSS, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", css).strip()
+
+
+st.markdown(page_style(), unsafe_allow_html=True)
 
 # Initialize session state variables
 if 'messages' not in st.session_state:
     st.session_state.messages = []
-if 'audio_playing' not in st.session_state:
-    st.session_state.audio_playing = False
+if 'spoken_count' not in st.session_state:
+    # Number of messages whose reply has already been handed to the speaker
+    st.session_state.spoken_count = 0
 if 'text_input_fallback' not in st.session_state:
     st.session_state.text_input_fallback = False
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:12]
+if 'last_trace' not in st.session_state:
+    # Metrics of the most recent turn, shown in the latency panel
+    st.session_state.last_trace = None
+if 'chat_view' not in st.session_state:
+    st.session_state.chat_view = ChatView()
+if 'memory' not in st.session_state:
+    # Bounded recent history given to the chat model; messages above is only for display
+    st.session_state.memory = ConversationMemory()
+if 'barge_in' not in st.session_state:
+    # Background listener for the user talking over the bot, while one is running
+    st.session_state.barge_in = None
 
-# Load environment variables
-load_dotenv()
+# Audio plays on a background worker; the script only sends it commands
+player = get_playback_service()
 
-# Play audio in a separate thread to avoid blocking
-def play_audio_file(file_path):
-    if not file_path:
-        return
-        
-    try:
-        pygame.mixer.music.load(file_path)
-        pygame.mixer.music.play()
-        st.session_state.audio_playing = True
-        
-        # Wait for playback to finish
-        while pygame.mixer.music.get_busy():
-            pygame.time.Clock().tick(10)
-        
-        st.session_state.audio_playing = False
-        
-        # Clean up temp file after playback
-        try:
-            os.remove(file_path)
-        except:
-            pass
-    except Exception as e:
-        print(f"Error playing audio: {str(e)}")
+# STT, chat and TTS run on a shared async pipeline so turns from different sessions overlap
+pipeline = get_background_pipeline()
+
+# Primes models in the background so the first turn doesn't wait on a cold start
+warmer = get_warmup_service()
+warmer.touch()
+
+def restore_history(session_id):
+    """Load the latest page of a stored conversation into this session."""
+    # One extra row tells whether there is anything older
+    restored = store.load(session_id, limit=CHAT_WINDOW + 1)
+    st.session_state.more_stored = len(restored) > CHAT_WINDOW
+    restored = restored[-CHAT_WINDOW:]
+    st.session_state.messages = [{"role": m['role'], "content": m['content']} for m in restored]
+    st.session_state.spoken_count = len(restored)
+    for user, bot in zip(restored, restored[1:]):
+        if user['role'] == 'user' and bot['role'] == 'assistant':
+            st.session_state.memory.add(user['content'], bot['content'])
+
+def load_earlier_history():
+    """Prepend the stored page before the oldest message held in memory."""
+    # The messages in memory are the session's newest, so skip that many once they are written
+    store.flush(timeout=5)
+    earlier = store.load(st.session_state.session_id, limit=CHAT_WINDOW + 1, skip=len(st.session_state.messages))
+    st.session_state.more_stored = len(earlier) > CHAT_WINDOW
+    earlier = earlier[-CHAT_WINDOW:]
+    st.session_state.messages[:0] = [{"role": m['role'], "content": m['content']} for m in earlier]
+    st.session_state.spoken_count += len(earlier)
+    st.session_state.chat_view.prepend(earlier)
+
+def trim_history():
+    """Keep at most CHAT_HISTORY_LIMIT messages in the session; the store still has the rest."""
+    excess = len(st.session_state.messages) - CHAT_HISTORY_LIMIT
+    if excess > 0:
+        del st.session_state.messages[:excess]
+        st.session_state.spoken_count = max(0, st.session_state.spoken_count - excess)
+        st.session_state.chat_view.trim(excess)
+        st.session_state.more_stored = store is not None
+
+# Conversations are kept in SQLite if CONVERSATION_DB is set; the session id in
+# the URL lets a reload or restart pick the conversation back up
+store = get_conversation_store()
+if 'more_stored' not in st.session_state:
+    # Whether the store has messages older than those in memory
+    st.session_state.more_stored = False
+    if store is not None:
+        if st.query_params.get("session"):
+            st.session_state.session_id = st.query_params["session"]
+            restore_history(st.session_state.session_id)
+        st.query_params["session"] = st.session_state.session_id
+
+# Prometheus-style metrics for the whole process, if METRICS_PORT is set
+if os.getenv("METRICS_PORT"):
+    metrics.start_metrics_server(int(os.getenv("METRICS_PORT")))
 
 # Custom header with animation
 st.markdown("""
@@ -257,28 +324,18 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# Display chat messages in a scrollable container
-st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-for message in st.session_state.messages:
-    if message['role'] == 'user':
-        st.markdown(f"""
-        <div class='chat-message user'>
-            <div class='avatar user'>👤</div>
-            <div class='message-content'>
-                <b>You:</b><br>{message['content']}
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown(f"""
-        <div class='chat-message bot'>
-            <div class='avatar bot'>🤖</div>
-            <div class='message-content'>
-                <b>Bot:</b><br>{message['content']}
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
-st.markdown('</div>', unsafe_allow_html=True)
+# Display the latest chat messages in a scrollable container; bubbles are
+# rendered once per message and earlier history is paged in on request
+chat_view = st.session_state.chat_view
+chat_view.sync(st.session_state.messages)
+if chat_view.hidden() or st.session_state.more_stored:
+    more = f" ({chat_view.hidden()} more)" if chat_view.hidden() else ""
+    if st.button(f"Show earlier messages{more}"):
+        if not chat_view.hidden():
+            load_earlier_history()
+        chat_view.show_earlier()
+        st.rerun()
+st.markdown(chat_view.html(), unsafe_allow_html=True)
 
 # Add some space
 st.write("")
@@ -293,15 +350,122 @@ st.session_state.text_input_fallback = use_text_input
 model_options = {
     "Standard": "google/flan-t5-small",
     "Advanced": "google/flan-t5-xl",
-    "Multilingual": "google/mt5-large"
+    "Multilingual": "google/mt5-large",
+    # Picks a model per message from input length and recent latency
+    "Auto": AUTO_MODEL
 }
 selected_model = st.sidebar.selectbox(
     "Choose AI model quality:",
     options=list(model_options.keys()),
     index=0
 )
+# Endpoints warming, recently ready or backing off after a failed prime are skipped, so a rerun
+# only re-primes models that are new, ready for over READY_TTL, or due for another attempt
+warm_models = list(MODELS) if model_options[selected_model] == AUTO_MODEL else [model_options[selected_model]]
+warmer.warm(*warm_models, STT, TTS)
+readiness = {"ready": "ready", "warming": "warming up...", "loading": "loading...",
+             "cold": "not loaded yet", "error": "unavailable"}
+if len(warm_models) == 1:
+    st.sidebar.caption(f"Model status: {readiness[warmer.status(warm_models[0])['state']]}")
+else:
+    st.sidebar.caption("Model status: " + ", ".join(
+        f"{name.split('/')[-1]} {readiness[warmer.status(name)['state']]}" for name in warm_models
+    ))
+
+# Voice endpointing: stop when the user stops talking instead of after a fixed 5 seconds
+auto_stop_recording = st.sidebar.checkbox("Stop recording when I stop speaking", value=True)
+
+# Streaming speech starts playing the first sentence while the rest is synthesized
+stream_speech = st.sidebar.checkbox("Stream speech sentence by sentence", value=True)
+
+# Streaming replies show tokens as they are generated and speak each finished sentence right away
+stream_replies = st.sidebar.checkbox("Show replies as they are generated", value=True)
+
+# Hedged requests race a slow or terse reply against the detailed XL model; the
+# race needs whole replies, so it only applies when replies aren't streamed
+hedge_requests = st.sidebar.checkbox("Race slow replies against the detailed model", value=HEDGE_ENABLED,
+                                     disabled=stream_replies) and not stream_replies
+last_playback = player.status()["last_metrics"]
+if last_playback and last_playback["time_to_first_audio"] is not None:
+    st.sidebar.caption(f"Time to first audio: {last_playback['time_to_first_audio']:.2f}s")
+elif last_playback and not last_playback["chunks"] and not last_playback["interrupted"]:
+    # Synthesis runs on the playback thread, so its errors are only logged there
+    st.sidebar.warning("The last reply couldn't be spoken: speech synthesis failed, see the log")
+cache_stats = response_cache_stats()
+st.sidebar.caption(f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                   f"({cache_stats['hit_rate']:.0%}); {cache_stats['follow_ups']} follow-ups, "
+                   f"which only match their own conversation")
+
+# Full-duplex mode: talking over the bot stops it and starts recording
+barge_in = st.sidebar.checkbox("Interrupt the bot by talking", value=False,
+                               disabled=use_text_input)
+if st.session_state.barge_in is not None and (not barge_in or use_text_input):
+    st.session_state.barge_in.stop()
+if st.sidebar.button("Stop speaking"):
+    player.stop()
+
+# Where the time went in the last turn
+if st.sidebar.checkbox("Show latency panel", value=False) and st.session_state.last_trace:
+    last_turn = st.session_state.last_trace.to_dict()
+    st.sidebar.markdown("**Last turn**")
+    st.sidebar.markdown("\n".join(
+        f"- {stage}: {last_turn['stages'][stage] * 1000:.0f} ms"
+        for stage in metrics.STAGES if stage in last_turn['stages']
+    ))
+    st.sidebar.caption(f"Sent {last_turn['bytes']['sent']:,} bytes, "
+                       f"received {last_turn['bytes']['received']:,} bytes")
+    for cache_name, counts in last_turn['cache'].items():
+        st.sidebar.caption(f"{cache_name} cache: {counts['hits']} hits, {counts['misses']} misses")
+    for model_name, model_stats in get_router().stats().items():
+        if model_stats["count"]:
+            st.sidebar.caption(f"{model_name.split('/')[-1]}: p95 {model_stats['p95']:.2f}s, "
+                               f"{model_stats['error_rate']:.0%} errors over {model_stats['count']} replies")
+
+def stream_reply(user_input, trace, time_left=None):
+    """
+    Show the bot's reply as it is generated and return it once complete.
+
+    The reply is generated by the pipeline's chat stage, under its
+    concurrency limit, and may take time_left seconds, the rest of the
+    turn's resilience.TURN_DEADLINE by default. With streaming speech on,
+    each finished sentence goes to TTS and playback while the rest of the
+    reply is still being generated; synthesis keeps pace with playback, so
+    it isn't held to the turn's deadline.
+    """
+    st.markdown(message_html('user', user_input), unsafe_allow_html=True)
+    bubble = st.empty()
+    if stream_speech:
+        # Playback reads chunks from this queue on its own thread; None ends the reply
+        text_chunks = queue.Queue()
+        player.play(synthesize_sentence_stream(stream_sentences(iter(text_chunks.get, None))))
+    reply = ""
+    try:
+        for chunk in pipeline.stream_turn(user_input=user_input, model=model_options[selected_model],
+                                          memory=st.session_state.memory, trace=trace, deadline=time_left):
+            reply += chunk
+            if stream_speech:
+                text_chunks.put(chunk)
+            bubble.markdown(message_html('assistant', reply), unsafe_allow_html=True)
+    finally:
+        if stream_speech:
+            text_chunks.put(None)
+    return reply.strip()
+
+def add_exchange(user_input, bot_response, spoken, audio=None):
+    """Add a turn to the chat; a reply already spoken while streaming isn't spoken again."""
+    st.session_state.messages.append({"role": "user", "content": user_input})
+    st.session_state.messages.append({"role": "assistant", "content": bot_response})
+    if store is not None:
+        # Written by the store's background thread; audio is the recorded upload, kept by content hash
+        store.append(st.session_state.session_id, "user", user_input, audio=audio)
+        store.append(st.session_state.session_id, "assistant", bot_response,
+                     meta={"model": model_options[selected_model]})
+    if spoken:
+        st.session_state.spoken_count = len(st.session_state.messages)
+    trim_history()
 
 # Input section
+record_button = False
 if use_text_input:
     # Text input as fallback
     st.markdown("<div class='text-input'>", unsafe_allow_html=True)
@@ -316,17 +480,19 @@ if use_text_input:
     st.markdown("</div>", unsafe_allow_html=True)
     
     if send_button and user_text.strip():
-        # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": user_text})
-        
         # Get bot response with the selected model
-        bot_response = get_bot_response(user_text, model=model_options[selected_model])
-        
-        # Add bot response to chat
-        st.session_state.messages.append({"role": "assistant", "content": bot_response})
+        trace = metrics.start_turn(st.session_state.session_id)
+        if stream_replies:
+            bot_response = stream_reply(user_text, trace)
+        else:
+            bot_response = pipeline.run_turn(user_input=user_text, model=model_options[selected_model],
+                                             hedge=hedge_requests, memory=st.session_state.memory,
+                                             trace=trace).bot_response
+        metrics.finish_turn(trace)
+        st.session_state.last_trace = trace
         
-        # Synthesize speech
-        speech_file = synthesize_speech(bot_response)
+        # Add the exchange to chat; unless streamed, speech is synthesized once, by the playback block after rerun
+        add_exchange(user_text, bot_response, spoken=stream_replies and stream_speech)
         
         # Rerun to update the chat interface
         st.rerun()
@@ -338,20 +504,8 @@ else:
     st.markdown("</div>", unsafe_allow_html=True)
     st.markdown("</div>", unsafe_allow_html=True)
 
-# Handle recording
-if record_button and not use_text_input:
-    # Show recording animation
-    recording_status = st.empty()
-    recording_status.markdown("""
-    <div class='status-message' style='background-color: #ffebee;'>
-        <div class='recording-animation'></div>
-        Recording... Speak now
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # Record audio
-    audio_data, samplerate = record_audio(duration=5)
-    
+def process_voice_input(audio_data, samplerate, recording_status, trace):
+    """Transcribe a recorded utterance, add the exchange to the chat and rerun."""
     # Update status
     recording_status.markdown("""
     <div class='status-message' style='background-color: #fff8e1;'>
@@ -359,23 +513,29 @@ if record_button and not use_text_input:
     </div>
     """, unsafe_allow_html=True)
     
-    # Process the audio
-    audio_path = save_audio(audio_data, samplerate)
-    user_input = transcribe_audio(audio_path)
+    # Process the audio in memory; set KEEP_AUDIO=1 to keep a copy on disk
+    audio_bytes = encode_audio(audio_data, samplerate)
+    turn = None
+    # Transcription and the reply share one deadline; recording doesn't count against it
+    with resilience.deadline(resilience.TURN_DEADLINE):
+        if audio_bytes:
+            # Transcribe and get the bot response with the selected model
+            # When streaming, the pipeline stops after transcription and the reply streams in below
+            turn = pipeline.run_turn(audio=audio_bytes, model=model_options[selected_model],
+                                     hedge=hedge_requests, respond=not stream_replies,
+                                     memory=st.session_state.memory, trace=trace)
+        time_left = resilience.remaining()
+    if turn is not None and stream_replies and turn.user_input and turn.user_input.strip():
+        recording_status.empty()
+        turn.bot_response = stream_reply(turn.user_input, trace, time_left)
+    metrics.finish_turn(trace)
+    st.session_state.last_trace = trace
     
     # Check if transcription was successful
-    if user_input and user_input.strip():
-        # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": user_input})
-        
-        # Get bot response with the selected model
-        bot_response = get_bot_response(user_input, model=model_options[selected_model])
-        
-        # Add bot response to chat
-        st.session_state.messages.append({"role": "assistant", "content": bot_response})
-        
-        # Synthesize speech
-        speech_file = synthesize_speech(bot_response)
+    if turn is not None and turn.bot_response is not None:
+        # Add the exchange to chat; unless streamed, speech is synthesized once, by the playback block after rerun
+        add_exchange(turn.user_input, turn.bot_response, spoken=stream_replies and stream_speech,
+                     audio=audio_bytes)
         
         # Clear the recording status
         recording_status.empty()
@@ -393,39 +553,105 @@ if record_button and not use_text_input:
         time.sleep(3)
         recording_status.empty()
 
-# Play the latest bot response automatically
-if st.session_state.messages and st.session_state.messages[-1]['role'] == 'assistant' and not st.session_state.audio_playing:
-    latest_message = st.session_state.messages[-1]['content']
+# Handle recording
+if record_button and not use_text_input:
+    # A button press also interrupts the bot if it is still talking, and takes the microphone
+    player.stop()
+    if st.session_state.barge_in is not None:
+        st.session_state.barge_in.stop()
+        st.session_state.barge_in = None
+
+    # Show recording animation
+    recording_status = st.empty()
+    recording_status.markdown("""
+    <div class='status-message' style='background-color: #ffebee;'>
+        <div class='recording-animation'></div>
+        Recording... Speak now
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Record audio
+    trace = metrics.start_turn(st.session_state.session_id)
+    if auto_stop_recording:
+        audio_data, samplerate = record_until_silence(max_duration=15)
+    else:
+        audio_data, samplerate = record_audio(duration=5)
+    
+    process_voice_input(audio_data, samplerate, recording_status, trace)
+
+def barge_in_done(monitor):
+    """
+    Whether the monitor captured a reply or the reply it listened over is
+    over; one that stopped early, e.g. without a microphone, isn't restarted
+    until the bot is done speaking.
+    """
+    return not monitor.running() and (monitor.captured is not None or not player.is_playing())
+
+# A barge-in captured by the monitor thread since the last run becomes this run's turn
+monitor = st.session_state.barge_in
+if monitor is not None and barge_in_done(monitor):
+    st.session_state.barge_in = None
+    if monitor.captured is not None and not use_text_input:
+        process_voice_input(monitor.captured[0], monitor.captured[1], st.empty(), monitor.trace)
+
+# Speak the latest bot response once, without blocking the script on playback
+messages = st.session_state.messages
+if messages and messages[-1]['role'] == 'assistant' and st.session_state.spoken_count < len(messages):
+    st.session_state.spoken_count = len(messages)
+    latest_message = messages[-1]['content']
     
-    # Visual indicator that the bot is speaking
-    speaking_status = st.empty()
-    speaking_status.markdown("""
+    # Attribute synthesis and playback start to the turn that produced this reply
+    with metrics.use_trace(st.session_state.last_trace):
+        if stream_speech:
+            player.play(synthesize_speech_chunks(latest_message))
+        else:
+            speech_audio = pipeline.run_turn(bot_response=latest_message,
+                                             trace=st.session_state.last_trace).speech
+            if speech_audio:
+                player.play(speech_audio)
+            else:
+                st.error("Speech synthesis failed, so the reply can't be spoken; see the log for details")
+
+def speaking_status():
+    """Visual indicator that the bot is speaking."""
+    st.markdown(f"""
     <div class='status-message' style='background-color: #e3f2fd;'>
-        Bot is speaking
+        Bot is speaking{" - start talking to interrupt" if barge_in and not use_text_input else ""}
         <div class='speaking-animation'>
             <span></span><span></span><span></span>
         </div>
     </div>
     """, unsafe_allow_html=True)
-    
-    # Generate and play the audio
-    speech_file = synthesize_speech(latest_message)
-    if speech_file:
-        # Start audio playback in a separate thread
-        audio_thread = threading.Thread(target=play_audio_file, args=(speech_file,))
-        audio_thread.start()
-        
-        # Wait briefly to ensure the thread starts
-        time.sleep(0.5)
-        
-        # Check if audio is actually playing
-        if st.session_state.audio_playing:
-            # Keep the speaking animation while audio is playing
-            while st.session_state.audio_playing:
-                time.sleep(0.1)
-                
-        # Clear speaking status when done
-        speaking_status.empty()
+
+@st.fragment(run_every=0.3)
+def barge_in_status():
+    """
+    Follow the barge-in monitor without blocking the script: show whether the
+    bot is speaking or the user's reply is being recorded, and rerun the app
+    once the monitor is done so a captured reply is processed.
+    """
+    monitor = st.session_state.barge_in
+    if monitor is None or barge_in_done(monitor):
+        st.rerun()
+    if player.is_playing():
+        speaking_status()
+    else:
+        st.markdown("""
+        <div class='status-message' style='background-color: #ffebee;'>
+            <div class='recording-animation'></div>
+            Recording... Speak now
+        </div>
+        """, unsafe_allow_html=True)
+
+listening = barge_in and not use_text_input
+if listening and (player.is_playing() or st.session_state.barge_in is not None):
+    # Listen over the bot's voice on a background thread; it stops the player if the user speaks
+    if st.session_state.barge_in is None:
+        trace = metrics.start_turn(st.session_state.session_id)
+        st.session_state.barge_in = BargeInMonitor(player, trace)
+    barge_in_status()
+elif player.is_playing():
+    speaking_status()
 
 # Instructions or help
 with st.expander("ℹ️ How to use"):
@@ -434,9 +660,10 @@ with st.expander("ℹ️ How to use"):
     
     **Voice Mode:**
     1. Click the **Press to speak** button
-    2. Speak clearly into your microphone 
+    2. Speak clearly into your microphone; recording stops when you pause
     3. Wait for the bot to respond both in text and voice
-    4. Continue the conversation by pressing the button again
+    4. Continue the conversation by pressing the button again, or enable
+       **Interrupt the bot by talking** to reply without pressing anything
     
     **Text Mode:**
     1. Enable text mode in the sidebar settings
@@ -0,0 +1,138 @@
+"""
+Startup and rerun timing for the Streamlit app.
+
+Measures how long the app's modules take to import in a fresh interpreter,
+and which heavy dependencies (scipy, sounddevice, pygame, PyMuPDF, ...) that
+import pulls in. Then runs app.py headless with Streamlit's AppTest against
+the local mock inference server, in text mode, and times the first script
+run and the reruns after it. Reports everything as JSON, so an eager import
+or per-rerun work creeping back into the page script shows up as a number.
+
+    python -m benchmarks.app_startup --reruns 20 --output startup.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.mock_server import MockServer, add_config_arguments, config_from_args
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# Modules the page script imports at the top
+APP_MODULES = [
+    "utils.speech_processing",
+    "utils.playback",
+    "utils.chatbot",
+    "utils.model_router",
+    "utils.chat_view",
+    "utils.conversation_store",
+    "utils.memory",
+    "utils.pipeline",
+    "utils.warmup",
+    "utils.metrics",
+]
+# Dependencies that should only load once a feature needs them
+HEAVY_MODULES = ["scipy", "scipy.signal", "scipy.sparse", "sounddevice", "soundfile", "pygame", "fitz"]
+
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def milliseconds(values):
+    data = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(data, 50)), 2),
+        "p95": round(float(np.percentile(data, 95)), 2),
+        "mean": round(float(data.mean()), 2),
+        "max": round(float(data.max()), 2),
+    }
+
+
+def measure_imports(repeats, env):
+    """Cold import time of APP_MODULES, each sample in a new interpreter."""
+    code = _IMPORT_PROBE.format(modules=APP_MODULES, heavy=HEAVY_MODULES)
+    samples = []
+    loaded = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded = result["loaded"]
+    return {"import_ms": milliseconds(samples), "heavy_modules_loaded": loaded}
+
+
+def measure_app(reruns, timeout):
+    """Time AppTest's first run of app.py in text mode, then each rerun."""
+    # Imported here so the environment is configured before the bot's modules load
+    from streamlit.testing.v1 import AppTest
+
+    # The mock server imports scipy itself, so only count what the app adds
+    already_loaded = set(sys.modules)
+    app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    started = time.perf_counter()
+    app.run()
+    first_run = time.perf_counter() - started
+    app.sidebar.checkbox[0].check()
+    app.run()
+
+    samples = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - started)
+    if app.exception:
+        raise RuntimeError(f"app.py raised: {app.exception[0].message}")
+    return {
+        "first_run_ms": round(first_run * 1000, 2),
+        "rerun_ms": milliseconds(samples),
+        "heavy_modules_loaded": [name for name in HEAVY_MODULES
+                                 if name in sys.modules and name not in already_loaded],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--import-repeats", type=int, default=5, help="Fresh interpreters to time imports in")
+    parser.add_argument("--reruns", type=int, default=20, help="Script reruns timed after the first run")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds AppTest waits for one run")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    # The app logs with print(); keep stdout for the JSON report so it can be redirected
+    with contextlib.redirect_stdout(sys.stderr), MockServer(config) as server, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["HF_API_BASE"] = server.base_url
+        os.environ["TTS_CACHE_DIR"] = cache_dir
+        os.environ.setdefault("METRICS_LOG", "0")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        results = measure_imports(args.import_repeats, dict(os.environ))
+        results.update(app=measure_app(args.reruns, args.timeout))
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Rerun cost of the chat history as a conversation grows.
+
+Runs app.py headless with Streamlit's AppTest against the local mock
+inference server, with the session's history pre-filled to each of the
+given lengths, and times the reruns after the first. Reports rerun
+latency and the number of markdown elements the script emitted per
+history length as JSON; both should stay flat, since only the latest
+CHAT_WINDOW messages are rendered and bubbles are cached per message.
+
+    python -m benchmarks.chat_render --lengths 10 100 1000 10000 --output render.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from benchmarks.app_startup import APP_PATH, milliseconds
+from benchmarks.mock_server import MockServer, add_config_arguments, config_from_args
+
+
+def history(length):
+    """A conversation of length messages with replies of realistic size."""
+    messages = []
+    for i in range(length):
+        if i % 2 == 0:
+            messages.append({"role": "user", "content": f"Question {i // 2}: what have you worked on recently?"})
+        else:
+            messages.append({"role": "assistant", "content": "I built a voice assistant with streaming speech. " * 6})
+    return messages
+
+
+def measure_length(length, reruns, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    app.session_state["messages"] = history(length)
+    app.session_state["spoken_count"] = length
+    started = time.perf_counter()
+    app.run()
+    first_run = time.perf_counter() - started
+
+    samples = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - started)
+    if app.exception:
+        raise RuntimeError(f"app.py raised: {app.exception[0].message}")
+    return {
+        "messages": length,
+        "first_run_ms": round(first_run * 1000, 2),
+        "rerun_ms": milliseconds(samples),
+        "markdown_elements": len(app.markdown),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="History lengths, in messages, to measure")
+    parser.add_argument("--reruns", type=int, default=20, help="Script reruns timed per history length")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds AppTest waits for one run")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    # The app's own output goes to stderr, leaving stdout to the report
+    with contextlib.redirect_stdout(sys.stderr), MockServer(config) as server, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["HF_API_BASE"] = server.base_url
+        os.environ["TTS_CACHE_DIR"] = cache_dir
+        os.environ.setdefault("METRICS_LOG", "0")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        results = [measure_length(length, args.reruns, args.timeout) for length in args.lengths]
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
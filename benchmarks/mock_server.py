@@ -0,0 +1,197 @@
+"""
+Local stand-in for the Hugging Face inference API.
+
+Serves /models/<owner>/<name> like the real endpoints the bot uses:
+whisper models return {"text": ...}, mms-tts models return WAV bytes and
+everything else returns [{"generated_text": ...}], or streams tokens as
+server-sent events when the request has "stream": true. Latency, payload sizes
+and the rate of 503 "model is currently loading" errors are configurable
+per endpoint kind, so benchmarks can run without network access.
+
+    python -m benchmarks.mock_server --port 8900 --llm-latency-ms 400 --error-rate 0.05
+    HF_API_BASE=http://localhost:8900 streamlit run app.py
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import random
+import threading
+import numpy as np
+import scipy.io.wavfile as wav
+from aiohttp import web
+
+
+class MockConfig:
+    """Behaviour of the mock endpoints; latencies in seconds, jitter as a fraction of the latency."""
+
+    def __init__(self, stt_latency=0.3, llm_latency=0.5, tts_latency=0.4, jitter=0.2,
+                 error_rate=0.0, estimated_time=2.0, reply_chars=160, tts_bytes_per_char=1600,
+                 token_interval=0.02, seed=None):
+        self.latency = {"stt": stt_latency, "llm": llm_latency, "tts": tts_latency}
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.estimated_time = estimated_time
+        self.reply_chars = reply_chars
+        # mms-tts returns 16 kHz 16-bit mono, roughly 0.05 s (1600 bytes) of audio per character
+        self.tts_bytes_per_char = tts_bytes_per_char
+        # Delay between streamed tokens; the latency above is the time to the first one
+        self.token_interval = token_interval
+        self.random = random.Random(seed)
+
+
+def _kind(model):
+    if "whisper" in model:
+        return "stt"
+    if "tts" in model:
+        return "tts"
+    return "llm"
+
+
+def _wav_bytes(size):
+    samples = max(1, (size - 44) // 2)
+    buffer = io.BytesIO()
+    wav.write(buffer, 16000, np.zeros(samples, dtype=np.int16))
+    return buffer.getvalue()
+
+
+async def _stream_tokens(request, reply, interval):
+    # Same event shape as text-generation-inference: one token per event, word by word
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    words = reply.split(" ")
+    for i, word in enumerate(words):
+        if i:
+            await asyncio.sleep(interval)
+        last = i == len(words) - 1
+        event = {
+            "token": {"id": i, "text": word if i == 0 else f" {word}", "special": False},
+            "generated_text": reply if last else None,
+        }
+        await response.write(f"data:{json.dumps(event)}\n\n".encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+def create_app(config):
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    counter = itertools.count(1)
+    stats = {"requests": {}, "errors": {}}
+    app["stats"] = stats
+
+    async def handle(request):
+        model = request.match_info["model"]
+        kind = _kind(model)
+        await request.read()
+        stats["requests"][kind] = stats["requests"].get(kind, 0) + 1
+
+        base = config.latency[kind]
+        await asyncio.sleep(max(0.0, config.random.gauss(base, base * config.jitter)))
+
+        if config.random.random() < config.error_rate:
+            stats["errors"][kind] = stats["errors"].get(kind, 0) + 1
+            return web.json_response(
+                {"error": f"Model {model} is currently loading", "estimated_time": config.estimated_time},
+                status=503,
+            )
+
+        n = next(counter)
+        if kind == "stt":
+            return web.json_response({"text": f"Tell me something interesting about topic number {n}"})
+        if kind == "tts":
+            payload = await request.json()
+            return web.Response(body=_wav_bytes(len(payload.get("inputs", "")) * config.tts_bytes_per_char),
+                                content_type="audio/wav")
+        sentence = f"Here is a fact about item {n}. "
+        reply = (sentence * (config.reply_chars // len(sentence) + 1))[:config.reply_chars].strip()
+        payload = await request.json()
+        if payload.get("stream"):
+            return await _stream_tokens(request, reply, config.token_interval)
+        return web.json_response([{"generated_text": reply}])
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app.router.add_post("/models/{model:.+}", handle)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+class MockServer:
+    """Runs the mock API on a background thread; use as a context manager."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockConfig()
+        self.host = host
+        self.port = port
+        self.app = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def stats(self):
+        return self.app["stats"]
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="mock-inference", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    async def _start(self):
+        self.app = create_app(self.config)
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--stt-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--tts-latency-ms", type=float, default=400)
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency stddev as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--estimated-time", type=float, default=2.0, help="estimated_time in 503 bodies")
+    parser.add_argument("--reply-chars", type=int, default=160, help="Length of generated replies")
+    parser.add_argument("--token-ms", type=float, default=20, help="Delay between streamed tokens")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args):
+    return MockConfig(stt_latency=args.stt_latency_ms / 1000, llm_latency=args.llm_latency_ms / 1000,
+                      tts_latency=args.tts_latency_ms / 1000, jitter=args.jitter, error_rate=args.error_rate,
+                      estimated_time=args.estimated_time, reply_chars=args.reply_chars,
+                      token_interval=args.token_ms / 1000, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(create_app(config_from_args(args)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
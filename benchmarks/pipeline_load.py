@@ -0,0 +1,146 @@
+"""
+Offline load benchmark for the voice pipeline.
+
+Starts the local mock inference server, points the bot at it and runs N
+concurrent simulated sessions through VoicePipeline, each doing a series of
+audio-in, speech-out turns. Reports turn latency percentiles, throughput,
+bytes per turn and per-stage timings as JSON, so pipeline regressions show
+up without network access.
+
+    python -m benchmarks.pipeline_load --sessions 8 --turns 10 --output load.json
+    python -m benchmarks.pipeline_load --sessions 32 --error-rate 0.05 --llm-latency-ms 800
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.mock_server import MockServer, add_config_arguments, config_from_args
+from benchmarks.stt_upload import synthetic_turn
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    data = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(data, 50)), 2),
+        "p90": round(float(np.percentile(data, 90)), 2),
+        "p95": round(float(np.percentile(data, 95)), 2),
+        "p99": round(float(np.percentile(data, 99)), 2),
+        "mean": round(float(data.mean()), 2),
+        "max": round(float(data.max()), 2),
+    }
+
+
+async def _session(pipeline, clips, model, think_time, results):
+    # Imported here so the environment is configured before the bot's modules load
+    from utils.chatbot import ERROR_RESPONSES
+
+    for audio in clips:
+        started = time.perf_counter()
+        turn = await pipeline.run_turn(audio=audio, model=model, synthesize=True)
+        elapsed = time.perf_counter() - started
+        failed = not turn.user_input or turn.bot_response in ERROR_RESPONSES or not turn.speech
+        results.append({"latency": elapsed, "failed": failed, "trace": turn.trace.to_dict()})
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def run_load(sessions, turns, model, think_time, upload_format, pipeline_options):
+    from utils import audio_encoding
+    from utils.pipeline import VoicePipeline
+
+    # A different utterance per turn, as real sessions would send; identical uploads
+    # would be coalesced into one upstream call and flatter every number
+    clips = [[audio_encoding.encode(synthetic_turn(16000, 1, seed=session * turns + turn), 16000, upload_format)
+              for turn in range(turns)] for session in range(sessions)]
+    pipeline = VoicePipeline(**pipeline_options)
+    await pipeline.start()
+    results = []
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*[
+            _session(pipeline, session_clips, model, think_time, results) for session_clips in clips
+        ])
+    finally:
+        await pipeline.stop()
+    wall_time = time.perf_counter() - started
+
+    stage_totals = {}
+    for result in results:
+        for stage, seconds in result["trace"]["stages"].items():
+            stage_totals.setdefault(stage, []).append(seconds)
+    count = len(results)
+    coalesced = {"hits": 0, "misses": 0}
+    for result in results:
+        for outcome, total in result["trace"]["cache"].get("single_flight", {}).items():
+            coalesced[outcome] += total
+    lookups = coalesced["hits"] + coalesced["misses"]
+    coalesced["hit_rate"] = round(coalesced["hits"] / lookups, 4) if lookups else 0.0
+    return {
+        "turns": count,
+        "failed_turns": sum(result["failed"] for result in results),
+        "wall_time_s": round(wall_time, 3),
+        "throughput_turns_per_s": round(count / wall_time, 3) if wall_time else 0.0,
+        "latency_ms": percentiles([result["latency"] for result in results]),
+        "bytes_per_turn": {
+            "sent": round(sum(r["trace"]["bytes"]["sent"] for r in results) / max(count, 1)),
+            "received": round(sum(r["trace"]["bytes"]["received"] for r in results) / max(count, 1)),
+            "upload_audio": round(float(np.mean([len(audio) for session in clips for audio in session]))),
+        },
+        # Calls that shared another session's identical in-flight request
+        "single_flight": coalesced,
+        "stage_mean_ms": {stage: round(1000 * float(np.mean(values)), 2)
+                          for stage, values in sorted(stage_totals.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=10, help="Turns per session")
+    parser.add_argument("--model", default="google/flan-t5-small")
+    parser.add_argument("--think-time-ms", type=float, default=0, help="Pause between a session's turns")
+    parser.add_argument("--upload-format", default="flac16k")
+    parser.add_argument("--stt-concurrency", type=int, default=2)
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--tts-concurrency", type=int, default=2)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_args(args)
+    # Pipeline stages log with print(); send that to stderr so stdout is only the report
+    with contextlib.redirect_stdout(sys.stderr), MockServer(config) as server, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        # Point the bot at the mock and keep caches from hiding endpoint latency
+        os.environ["HF_API_BASE"] = server.base_url
+        os.environ["TTS_CACHE_DIR"] = cache_dir
+        os.environ.setdefault("METRICS_LOG", "0")
+        pipeline_options = {
+            "stt_concurrency": args.stt_concurrency,
+            "llm_concurrency": args.llm_concurrency,
+            "tts_concurrency": args.tts_concurrency,
+        }
+        results = asyncio.run(run_load(args.sessions, args.turns, args.model, args.think_time_ms / 1000,
+                                       args.upload_format, pipeline_options))
+        results["mock_requests"] = server.stats
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark speech-to-text upload formats.
+
+Encodes a synthetic voice turn (speech-like tone surrounded by room noise)
+with every format in audio_encoding.UPLOAD_FORMATS and reports encoded bytes
+and encode time. With --url, each payload is also POSTed to that endpoint to
+measure upload latency.
+
+    python -m benchmarks.stt_upload --samplerate 44100 --channels 2
+    python -m benchmarks.stt_upload --url http://localhost:8000/stt --output stt.json
+"""
+import argparse
+import contextlib
+import json
+import sys
+import time
+import numpy as np
+from utils import audio_encoding
+
+
+def synthetic_turn(samplerate, channels, seconds=5.0, speech_seconds=2.5, seed=0):
+    """Silence-padded harmonic tone standing in for one recorded utterance."""
+    rng = np.random.default_rng(seed)
+    total = int(samplerate * seconds)
+    audio = rng.normal(0, 60, total)
+    start = int(samplerate * (seconds - speech_seconds) / 2)
+    t = np.arange(int(samplerate * speech_seconds)) / samplerate
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t))
+    voice = sum(np.sin(2 * np.pi * f * t) / i for i, f in enumerate((180, 360, 540, 720), start=1))
+    audio[start:start + len(t)] += 6000 * envelope * voice
+    audio = np.clip(audio, -32768, 32767).astype(np.int16)
+    if channels > 1:
+        audio = np.repeat(audio[:, None], channels, axis=1)
+    return audio
+
+
+def run(samplerate, channels, repeats, url=None):
+    audio = synthetic_turn(samplerate, channels)
+    results = []
+    for fmt in audio_encoding.UPLOAD_FORMATS:
+        encode_times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            payload = audio_encoding.encode(audio, samplerate, fmt)
+            encode_times.append(time.perf_counter() - started)
+        result = {
+            "format": fmt,
+            "bytes": len(payload),
+            "content_type": audio_encoding.content_type(payload),
+            "encode_ms": round(1000 * float(np.median(encode_times)), 3),
+        }
+        if url:
+            from utils import http_client
+
+            upload_times = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                http_client.post(url, headers={"Content-Type": result["content_type"]}, data=payload)
+                upload_times.append(time.perf_counter() - started)
+            result["upload_ms"] = round(1000 * float(np.median(upload_times)), 3)
+        results.append(result)
+    baseline = results[0]["bytes"]
+    for result in results:
+        result["ratio_vs_wav"] = round(baseline / result["bytes"], 2)
+    return {"samplerate": samplerate, "channels": channels, "repeats": repeats, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samplerate", type=int, default=16000)
+    parser.add_argument("--channels", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--url", help="Endpoint to POST each payload to for upload latency")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    # Retries are logged with print(); keep them out of the report on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args.samplerate, args.channels, args.repeats, args.url)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
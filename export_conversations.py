@@ -0,0 +1,41 @@
+"""
+Export stored conversations as JSON lines for offline analysis.
+
+Messages are streamed out oldest first, one JSON object per line, with
+audio given by its sha256 in the store's audio table. Memory use doesn't
+grow with the number of turns.
+
+Usage:
+    CONVERSATION_DB=conversations.db python export_conversations.py --output turns.jsonl
+    python export_conversations.py --db conversations.db --since 2026-01-01 | gzip > turns.jsonl.gz
+"""
+import argparse
+import sys
+from datetime import datetime
+from utils.conversation_store import DB_PATH, SQLiteConversationStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DB_PATH, help="SQLite file (default: CONVERSATION_DB)")
+    parser.add_argument("--session", help="Only export this session")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Only messages from this ISO date or time on")
+    parser.add_argument("--output", help="JSONL file to write (default: stdout)")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("pass --db or set CONVERSATION_DB")
+
+    store = SQLiteConversationStore(args.db)
+    since = args.since.timestamp() if args.since else None
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        count = store.export(out, session_id=args.session, since=since)
+    finally:
+        if args.output:
+            out.close()
+        store.close()
+    print(f"Exported {count} messages", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
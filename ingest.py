@@ -0,0 +1,27 @@
+"""
+Batch ingestion of a directory of PDFs into a compact on-disk corpus.
+
+Pages are extracted across a process pool and streamed to disk; files that
+haven't changed since the last run are copied over without being parsed.
+Point the knowledge base at the result with KNOWLEDGE_CORPUS.
+
+Usage:
+    python ingest.py resumes/ --output corpus/ --workers 8
+    KNOWLEDGE_CORPUS=corpus/ streamlit run app.py
+"""
+import argparse
+import json
+from utils.corpus import ingest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory searched recursively for PDFs")
+    parser.add_argument("--output", default="corpus", help="Corpus directory to create or update")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: CPU count)")
+    args = parser.parse_args()
+    print(json.dumps(ingest(args.source, args.output, args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
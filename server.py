@@ -0,0 +1,207 @@
+"""
+Headless HTTP/WebSocket server for the voice bot.
+
+Endpoints:
+    GET  /health      liveness check plus warm-up state of each model endpoint
+    GET  /metrics     per-stage latency, bytes and cache metrics in Prometheus text format
+    POST /chat        {"text": ..., "model": ..., "hedge": ...} -> {"user_input", "bot_response"};
+                      "model" is a chatbot.MODELS key or "auto"
+    POST /voice       encoded audio body -> {"user_input", "bot_response"}
+    POST /speak       {"text": ...} -> audio/wav
+    GET  /ws          WebSocket: send a binary frame of encoded audio or a JSON
+                      {"text": ...} message per turn; the server answers with
+                      {"type": "transcript"} and {"type": "reply"} messages, then
+                      streams the spoken reply as binary WAV chunks, one per
+                      sentence, followed by {"type": "audio_end"}.
+
+Usage:
+    python server.py --port 8080 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+from aiohttp import WSMsgType, web
+from utils import metrics
+from utils.chatbot import MODELS
+from utils.memory import ConversationMemory
+from utils.model_router import AUTO_MODEL
+from utils.pipeline import DEFAULT_MODEL, VoicePipeline
+from utils.speech_processing import synthesize_speech_chunks
+from utils.warmup import STT, TTS, get_warmup_service
+
+PIPELINE_KEY = web.AppKey("pipeline", VoicePipeline)
+
+
+def _turn_options(payload):
+    model = payload.get("model", DEFAULT_MODEL)
+    if model not in MODELS and model != AUTO_MODEL:
+        raise web.HTTPBadRequest(text=f"Unknown model '{model}', expected one of {list(MODELS) + [AUTO_MODEL]}")
+    # Query strings carry "1"/"true", JSON bodies carry booleans
+    hedge = payload.get("hedge", False) in (True, 1, "1", "true")
+    warmer = get_warmup_service()
+    warmer.touch()
+    warmer.warm(*(MODELS if model == AUTO_MODEL else [model]))
+    return {"model": model, "hedge": hedge}
+
+
+async def _read_json(request):
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="Body must be JSON")
+    if not isinstance(payload, dict) or not str(payload.get("text", "")).strip():
+        raise web.HTTPBadRequest(text="Body must be a JSON object with a non-empty 'text'")
+    return payload
+
+
+async def health(request):
+    readiness = {name: status["state"] for name, status in get_warmup_service().statuses().items()}
+    return web.json_response({"status": "ok", "models": readiness})
+
+
+async def prometheus_metrics(request):
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+
+async def chat(request):
+    payload = await _read_json(request)
+    turn = await request.app[PIPELINE_KEY].run_turn(user_input=payload["text"], **_turn_options(payload))
+    return web.json_response(turn.to_dict())
+
+
+async def voice(request):
+    audio = await request.read()
+    if not audio:
+        raise web.HTTPBadRequest(text="Body must contain encoded audio")
+    turn = await request.app[PIPELINE_KEY].run_turn(audio=audio, **_turn_options(request.query))
+    if not turn.user_input:
+        raise web.HTTPUnprocessableEntity(text="Could not transcribe any speech")
+    return web.json_response(turn.to_dict())
+
+
+async def speak(request):
+    payload = await _read_json(request)
+    turn = await request.app[PIPELINE_KEY].run_turn(bot_response=payload["text"])
+    if not turn.speech:
+        raise web.HTTPBadGateway(text="Speech synthesis failed")
+    return web.Response(body=turn.speech, content_type="audio/wav")
+
+
+async def _stream_speech(ws, text, trace):
+    """Send the reply as sentence-sized WAV chunks while later sentences are still synthesizing."""
+    loop = asyncio.get_running_loop()
+    context = metrics.context_with(trace)
+    chunks = synthesize_speech_chunks(text)
+    sent = 0
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, context.run, next, chunks, None)
+            if chunk is None:
+                break
+            await ws.send_bytes(chunk)
+            sent += 1
+    finally:
+        chunks.close()
+    await ws.send_json({"type": "audio_end", "chunks": sent})
+
+
+async def websocket(request):
+    options = _turn_options(request.query)
+    pipeline = request.app[PIPELINE_KEY]
+    # A WebSocket is one conversation, so the bot remembers earlier turns on it
+    options["memory"] = ConversationMemory()
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+
+    async for msg in ws:
+        if msg.type == WSMsgType.BINARY:
+            turn = await pipeline.run_turn(audio=msg.data, **options)
+            await ws.send_json({"type": "transcript", "text": turn.user_input or ""})
+            if not turn.user_input:
+                continue
+        elif msg.type == WSMsgType.TEXT:
+            try:
+                payload = json.loads(msg.data)
+                text = str(payload["text"]).strip()
+            except (json.JSONDecodeError, KeyError, TypeError):
+                await ws.send_json({"type": "error", "message": "Expected JSON with a 'text' field"})
+                continue
+            if not text:
+                continue
+            turn = await pipeline.run_turn(user_input=text, **options)
+        else:
+            break
+
+        await ws.send_json({"type": "reply", "text": turn.bot_response})
+        await _stream_speech(ws, turn.bot_response, turn.trace)
+    return ws
+
+
+def create_app(**pipeline_options):
+    """Build the aiohttp application around a VoicePipeline."""
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app[PIPELINE_KEY] = VoicePipeline(**pipeline_options)
+
+    async def start_pipeline(app):
+        await app[PIPELINE_KEY].start()
+        get_warmup_service().warm(DEFAULT_MODEL, STT, TTS)
+
+    async def stop_pipeline(app):
+        await app[PIPELINE_KEY].stop()
+
+    app.on_startup.append(start_pipeline)
+    app.on_cleanup.append(stop_pipeline)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", prometheus_metrics)
+    app.router.add_post("/chat", chat)
+    app.router.add_post("/voice", voice)
+    app.router.add_post("/speak", speak)
+    app.router.add_get("/ws", websocket)
+    return app
+
+
+def _serve(host, port, reuse_port, pipeline_options):
+    web.run_app(create_app(**pipeline_options), host=host, port=port, reuse_port=reuse_port,
+                print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes sharing the port via SO_REUSEPORT")
+    parser.add_argument("--stt-concurrency", type=int, default=2)
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--tts-concurrency", type=int, default=2)
+    args = parser.parse_args()
+
+    pipeline_options = {
+        "stt_concurrency": args.stt_concurrency,
+        "llm_concurrency": args.llm_concurrency,
+        "tts_concurrency": args.tts_concurrency,
+    }
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} worker(s)")
+    if args.workers == 1:
+        _serve(args.host, args.port, False, pipeline_options)
+        return
+
+    # Each worker has its own event loop and pipeline; the kernel balances connections between them
+    workers = [
+        multiprocessing.Process(target=_serve, args=(args.host, args.port, True, pipeline_options),
+                                name=f"voicebot-worker-{i}")
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == "__main__":
+    main()
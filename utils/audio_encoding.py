@@ -0,0 +1,108 @@
+import io
+from math import gcd
+import threading
+import numpy as np
+from utils.vad import trim_silence
+
+# scipy and soundfile take over a second to import together, so they are only
+# loaded once audio is actually encoded
+_soundfile = None
+_soundfile_lock = threading.Lock()
+
+STT_SAMPLERATE = 16000
+
+# Upload formats for speech-to-text: (container, downmix/resample/trim first)
+UPLOAD_FORMATS = {
+    "wav": ("wav", False),
+    "wav16k": ("wav", True),
+    "flac": ("flac", False),
+    "flac16k": ("flac", True),
+}
+
+
+def get_soundfile():
+    """Import soundfile once per process, or return None if it isn't usable."""
+    global _soundfile
+    if _soundfile is None:
+        with _soundfile_lock:
+            if _soundfile is None:
+                try:
+                    import soundfile
+                    _soundfile = soundfile
+                except (ImportError, OSError):
+                    # soundfile needs libsndfile; without it FLAC formats fall back to WAV
+                    _soundfile = False
+    return _soundfile or None
+
+
+def to_int16(audio):
+    """Convert float or integer samples to int16 without changing the shape."""
+    audio = np.asarray(audio)
+    if audio.dtype == np.int16:
+        return audio
+    if np.issubdtype(audio.dtype, np.floating):
+        return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    return np.clip(audio, -32768, 32767).astype(np.int16)
+
+
+def prepare_for_stt(audio, samplerate, target_rate=STT_SAMPLERATE, trim=True):
+    """
+    Downmix to mono, resample to target_rate and trim silence.
+
+    Whisper works on 16 kHz mono internally, so anything beyond that is
+    wasted upload bytes.
+
+    Returns:
+        tuple: (audio, samplerate) with audio as a 1-D int16 array
+    """
+    audio = to_int16(audio)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    if samplerate != target_rate:
+        from scipy.signal import resample_poly
+        divisor = gcd(int(samplerate), int(target_rate))
+        audio = resample_poly(audio, target_rate // divisor, samplerate // divisor)
+        samplerate = target_rate
+    if audio.dtype != np.int16:
+        audio = np.clip(np.round(audio), -32768, 32767).astype(np.int16)
+    if trim:
+        audio = trim_silence(audio, samplerate)
+    return audio, samplerate
+
+
+def encode(audio, samplerate, fmt="wav"):
+    """
+    Encode audio for upload.
+
+    Args:
+        audio (np.ndarray): int16 samples, mono or (n, channels)
+        samplerate (int): Sample rate of the audio
+        fmt (str): One of UPLOAD_FORMATS
+
+    Returns:
+        bytes: The encoded audio
+    """
+    if fmt not in UPLOAD_FORMATS:
+        raise ValueError(f"Unknown upload format '{fmt}', expected one of {list(UPLOAD_FORMATS)}")
+    container, preprocess = UPLOAD_FORMATS[fmt]
+    if preprocess:
+        audio, samplerate = prepare_for_stt(audio, samplerate)
+    audio = to_int16(audio)
+
+    buffer = io.BytesIO()
+    sf = get_soundfile() if container == "flac" else None
+    if sf is not None:
+        sf.write(buffer, audio, samplerate, format="FLAC", subtype="PCM_16")
+    else:
+        import scipy.io.wavfile as wav
+        if container == "flac":
+            print("soundfile is not available, uploading WAV instead of FLAC")
+        wav.write(buffer, samplerate, audio)
+    return buffer.getvalue()
+
+
+def content_type(audio_bytes):
+    """Guess the MIME type of encoded audio from its header."""
+    if audio_bytes[:4] == b"fLaC":
+        return "audio/flac"
+    return "audio/wav"
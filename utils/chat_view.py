@@ -0,0 +1,83 @@
+import os
+
+# Messages shown at first, and added each time earlier history is paged in
+CHAT_WINDOW = int(os.getenv("CHAT_WINDOW", "20"))
+# Messages a session keeps in memory; older ones are dropped, or paged back in
+# from the conversation store when one is configured
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "200"))
+
+
+def message_html(role, content):
+    """Chat bubble markup for one message."""
+    if role == 'user':
+        return f"""
+        <div class='chat-message user'>
+            <div class='avatar user'>👤</div>
+            <div class='message-content'>
+                <b>You:</b><br>{content}
+            </div>
+        </div>
+        """
+    return f"""
+        <div class='chat-message bot'>
+            <div class='avatar bot'>🤖</div>
+            <div class='message-content'>
+                <b>Bot:</b><br>{content}
+            </div>
+        </div>
+        """
+
+
+class ChatView:
+    """
+    Rendered chat history for one session.
+
+    Each message's bubble is rendered once, when it is first seen, and kept;
+    later runs only render messages appended since. Only the latest `window`
+    messages are shown, as a single block of markup that is rebuilt when a
+    message arrives or earlier history is paged in, so a rerun costs the
+    same however long the conversation is.
+    """
+
+    def __init__(self, window=CHAT_WINDOW):
+        self.window = window
+        self.visible = window
+        self._html = []
+        self._block = None
+        self._block_range = None
+
+    def sync(self, messages):
+        """Render messages not seen yet; messages is the session's full list of dicts."""
+        if len(messages) < len(self._html):
+            # The history was replaced, e.g. cleared
+            self._html = []
+            self._block_range = None
+            self.visible = self.window
+        for message in messages[len(self._html):]:
+            self._html.append(message_html(message['role'], message['content']))
+
+    def prepend(self, messages):
+        """Render history loaded from before the first message, e.g. from the conversation store."""
+        self._html[:0] = [message_html(message['role'], message['content']) for message in messages]
+        self._block_range = None
+
+    def trim(self, count):
+        """Forget the oldest count messages, after they were dropped from the session's list."""
+        del self._html[:count]
+        self._block_range = None
+
+    def hidden(self):
+        """Number of earlier messages not in the window."""
+        return max(0, len(self._html) - self.visible)
+
+    def show_earlier(self):
+        self.visible += self.window
+
+    def html(self):
+        """Markup of the visible messages, wrapped in the scrollable chat container."""
+        visible_range = (self.hidden(), len(self._html))
+        if visible_range != self._block_range:
+            bubbles = "".join(self._html[visible_range[0]:])
+            self._block = f'<div class="chat-container">{bubbles}</div>'
+            self._block_range = visible_range
+        return self._block
@@ -1,72 +1,396 @@
-import requests
+import contextvars
+import json
 import os
-from dotenv import load_dotenv
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from utils import http_client, metrics, model_router, resilience, response_cache
+from utils.knowledge import get_knowledge_base
+from utils.memory import estimate_tokens, history_budget
 
-load_dotenv()
-HF_API_KEY = os.getenv("HF_API_KEY")
-HEADERS = {"Authorization": f"Bearer {HF_API_KEY}"}
-
-# Dictionary of models with their URLs and parameters
+# Dictionary of models with their URLs and parameters; "fallback" names the
+# model tried next when one is failing or its circuit breaker is open
 MODELS = {
     "google/flan-t5-small": {
-        "url": "https://api-inference.huggingface.co/models/google/flan-t5-small",
+        "url": f"{http_client.HF_API_BASE}/models/google/flan-t5-small",
         "max_length": 150,
-        "temperature": 0.7
+        "temperature": 0.7,
+        "fallback": None
     },
     "google/flan-t5-xl": {
-        "url": "https://api-inference.huggingface.co/models/google/flan-t5-xl",
+        "url": f"{http_client.HF_API_BASE}/models/google/flan-t5-xl",
         "max_length": 200,
-        "temperature": 0.8
+        "temperature": 0.8,
+        "fallback": "google/flan-t5-small"
     },
     "google/mt5-large": {
-        "url": "https://api-inference.huggingface.co/models/google/mt5-large",
+        "url": f"{http_client.HF_API_BASE}/models/google/mt5-large",
         "max_length": 180,
-        "temperature": 0.75
+        "temperature": 0.75,
+        "fallback": "google/flan-t5-small"
     }
 }
 
-def get_bot_response(user_input, model="google/flan-t5-small"):
+# Canned replies are fixed strings so the TTS cache serves them after the first synthesis
+THINKING_ERROR_RESPONSE = "I'm having trouble thinking right now. Let's talk about something else."
+CONNECTION_ERROR_RESPONSE = "I'm having trouble connecting right now. Please try again in a moment."
+UNSURE_RESPONSE = "I'm not sure how to respond to that."
+ERROR_RESPONSES = (THINKING_ERROR_RESPONSE, CONNECTION_ERROR_RESPONSE)
+
+# Replies shorter than this get a second, more detailed attempt from flan-t5-xl
+MIN_RESPONSE_LENGTH = 20
+
+# Hedged mode: if the primary model hasn't answered within CHAT_HEDGE_AFTER seconds
+# (or answers too briefly), race it against the detailed flan-t5-xl request
+HEDGE_ENABLED = os.getenv("CHAT_HEDGE", "0") == "1"
+HEDGE_AFTER = float(os.getenv("CHAT_HEDGE_AFTER", "1.5"))
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+# Chat pools are sized per model so a slow XL request can't starve the small model
+CHAT_POOL_SIZE = 4
+for _config in MODELS.values():
+    http_client.register_endpoint(_config["url"], CHAT_POOL_SIZE)
+
+def generation_parameters(model_config):
+    """Sampling parameters sent with every chat request for a model."""
+    return {
+        "max_length": model_config["max_length"],
+        "temperature": model_config["temperature"],
+        "top_p": 0.95,
+        "top_k": 50,
+        "repetition_penalty": 1.2,
+        "do_sample": True
+    }
+
+def get_bot_response(user_input, model="google/flan-t5-small", use_cache=True, hedge=None, memory=None):
     """
     Get response from Hugging Face API based on user input.
     
     Args:
         user_input (str): The user's input/query
-        model (str): The model to use for generating a response
+        model (str): The model to use for generating a response, or
+            model_router.AUTO_MODEL to pick one by input and recent latency
+        use_cache (bool): Serve repeated questions from the response cache;
+            pass False when a fresh sample is wanted
+        hedge (bool): Race slow or short replies against the detailed XL
+            request; defaults to the CHAT_HEDGE setting
+        memory (ConversationMemory): The conversation so far; recent turns go
+            into the prompt within the model's budget and this turn is added.
+            Passages from the knowledge base (knowledge.py) matching the
+            input are always added when there are any
         
     Returns:
         str: The bot's response
     """
+    model, parameters, context, cache_context, cached = _prepare(user_input, model, use_cache, memory)
+    if cached is not None:
+        return cached
+
+    if hedge is None:
+        hedge = HEDGE_ENABLED
+    bot_response = CONNECTION_ERROR_RESPONSE
+    answered_by = None
+    for candidate, candidate_parameters, candidate_context in _attempts(user_input, model, context, memory):
+        with _routed(candidate) as attempt:
+            if hedge:
+                bot_response = _hedged_response(user_input, MODELS[candidate], candidate_parameters,
+                                                candidate_context)
+            else:
+                bot_response = _generate_response(user_input, MODELS[candidate], candidate_parameters,
+                                                  candidate_context)
+            attempt["ok"] = bot_response not in ERROR_RESPONSES
+        if attempt["ok"]:
+            answered_by = candidate
+            break
+
+    _record(user_input, model, parameters, cache_context, bot_response, answered_by, use_cache, memory)
+    return bot_response
+
+def _prepare(user_input, model, use_cache, memory):
+    """
+    Resolve model (routing AUTO_MODEL), build its prompt context and look the
+    input up in the response cache.
+
+    Replies to self-contained questions don't depend on earlier turns, so
+    they are keyed on the knowledge passages alone and are shared across
+    conversations. A follow-up (response_cache.is_follow_up) is keyed on the
+    whole context, so it only matches the same conversation.
+
+    Returns:
+        tuple: (model, parameters, context, cache context, cached reply or None)
+    """
+    if model == model_router.AUTO_MODEL:
+        model = model_router.get_router().choose(
+            user_input, available=lambda name: resilience.is_available(MODELS[name]["url"]))
+    if model not in MODELS:
+        model = "google/flan-t5-small"
+    parameters = generation_parameters(MODELS[model])
+    reference, history = _prompt_sections(user_input, memory, MODELS[model])
+    context = "\n".join(section for section in (reference, history) if section)
+    follow_up = bool(history) and response_cache.is_follow_up(user_input)
+    cache_context = context if follow_up else reference
+    cache = response_cache.get_cache()
+
+    cached = None
+    if not use_cache:
+        cache.record_bypass()
+    else:
+        cached = cache.get(model, user_input, parameters, cache_context)
+        metrics.cache_event("response", cached is not None)
+        if follow_up:
+            cache.record_follow_up()
+        if cached is not None and memory is not None:
+            memory.add(user_input, cached)
+    return model, parameters, context, cache_context, cached
+
+def _attempts(user_input, model, context, memory):
+    """
+    Yield (candidate, parameters, context) down the model's fallback chain,
+    skipping models whose circuit breaker is open. The caller stops iterating
+    once a candidate answers; the chain also ends when the deadline is spent.
+    """
+    for candidate in fallback_chain(model):
+        # Skip straight past models whose endpoint is known to be down
+        if not resilience.is_available(MODELS[candidate]["url"]):
+            print(f"Skipping {candidate}, its circuit breaker is open")
+            continue
+        if candidate == model:
+            candidate_context = context
+        else:
+            candidate_context = _prompt_context(user_input, memory, MODELS[candidate])
+        yield candidate, generation_parameters(MODELS[candidate]), candidate_context
+        if resilience.remaining() <= 0:
+            return
+        print(f"{candidate} failed")
+
+@contextmanager
+def _routed(candidate):
+    """
+    Feed one attempt into the router's latency and error statistics.
+
+    Yields a dict whose "ok" the caller sets once the attempt succeeded;
+    "started" is its perf_counter start time.
+    """
+    attempt = {"ok": False, "started": time.perf_counter()}
+    router = model_router.get_router()
+    router.started(candidate)
     try:
-        # Get model configuration
-        model_config = MODELS.get(model, MODELS["google/flan-t5-small"])
-        chat_url = model_config["url"]
-        max_length = model_config["max_length"]
-        temperature = model_config["temperature"]
+        yield attempt
+    finally:
+        attempt["elapsed"] = time.perf_counter() - attempt["started"]
+        router.finished(candidate, attempt["elapsed"], ok=attempt["ok"])
+
+def _record(user_input, model, parameters, cache_context, bot_response, answered_by, use_cache, memory):
+    """Cache and remember a reply once the fallback chain is done."""
+    # Errors are transient and fallback answers are degraded, so only real
+    # answers from the requested model are cached
+    if use_cache and answered_by == model:
+        response_cache.get_cache().put(model, user_input, parameters, bot_response, cache_context)
+    if memory is not None and answered_by is not None:
+        memory.add(user_input, bot_response)
+
+def _prompt_sections(user_input, memory, model_config):
+    """
+    Knowledge-base passages relevant to the input and earlier turns, within
+    the model's budget; passages may use up to half of it.
+
+    Returns:
+        tuple: (passages, history), each "" if there is none
+    """
+    budget = history_budget(model_config)
+    reference = get_knowledge_base().context(user_input, budget // 2)
+    if reference:
+        budget -= estimate_tokens(reference)
+    history = memory.context(budget) if memory else ""
+    return reference, history or ""
+
+def _prompt_context(user_input, memory, model_config):
+    """Knowledge-base passages relevant to the input, then earlier turns, as prompt text."""
+    return "\n".join(section for section in _prompt_sections(user_input, memory, model_config) if section)
+
+def stream_bot_response(user_input, model="google/flan-t5-small", use_cache=True, memory=None, hedge=False):
+    """
+    Like get_bot_response, but yield the reply in chunks as it is generated.
+
+    Uses the endpoint's streaming mode (server-sent events) when it offers
+    one. Otherwise the whole reply arrives at once, and a short one is
+    enhanced as in get_bot_response before it is yielded. A streamed reply
+    is on screen before its length is known, so it is never enhanced. Model
+    routing, the fallback chain and the response cache work as in
+    get_bot_response.
+
+    Args:
+        user_input (str): The user's input/query
+        model (str): The model to use, or model_router.AUTO_MODEL
+        use_cache (bool): Serve repeated questions from the response cache
+        memory (ConversationMemory): The conversation so far, as in get_bot_response
+        hedge (bool): Race slow or short replies against the detailed XL
+            request as in get_bot_response; the winner is yielded whole
+
+    Yields:
+        str: Consecutive pieces of the bot's response
+    """
+    model, parameters, context, cache_context, cached = _prepare(user_input, model, use_cache, memory)
+    if cached is not None:
+        yield cached
+        return
+
+    received = []
+    answered_by = None
+    for candidate, candidate_parameters, candidate_context in _attempts(user_input, model, context, memory):
+        with _routed(candidate) as attempt:
+            if hedge:
+                chunks = _hedged_chunks(user_input, MODELS[candidate], candidate_parameters, candidate_context)
+            else:
+                chunks = _stream_reply(user_input, MODELS[candidate], candidate_parameters, candidate_context)
+            try:
+                for chunk in chunks:
+                    if not received:
+                        metrics.observe("first_token", time.perf_counter() - attempt["started"])
+                    received.append(chunk)
+                    yield chunk
+                attempt["ok"] = bool(received)
+            except Exception as e:
+                print(f"Error streaming bot response: {str(e)}")  # Debugging
+            finally:
+                # A hedged reply's requests are timed by _request_reply itself
+                if not hedge:
+                    metrics.observe("llm", time.perf_counter() - attempt["started"])
+        if attempt["ok"]:
+            answered_by = candidate
+            break
+        if received:
+            # Part of the reply is already on screen, so it can't be replaced by a
+            # fallback; it is shown as is but counted as a failure and not kept
+            print(f"{candidate} failed mid-reply")
+            return
+
+    if not received:
+        yield CONNECTION_ERROR_RESPONSE
+        return
+    _record(user_input, model, parameters, cache_context, "".join(received).strip(), answered_by, use_cache, memory)
+
+def _stream_reply(user_input, model_config, parameters, context=""):
+    """
+    Yield the chat model's reply as it streams in.
+
+    Yields nothing if the endpoint answers with an error status; raises if the
+    connection or the stream fails, including after part of the reply.
+    """
+    prefix = "Assistant:"
+    response = http_client.post_stream(
+        model_config["url"],
+        json={
+            "inputs": build_prompt(user_input, context),
+            "parameters": parameters,
+            "stream": True
+        }
+    )
+    with response:
+        if response.status_code != 200:
+            print(f"API Error: {response.status_code} - {response.text}")  # Debugging
+            return
+        if not response.headers.get("Content-Type", "").startswith("text/event-stream"):
+            # No streaming on this endpoint: the body is the usual JSON reply
+            metrics.add_bytes(received=len(response.content))
+            result = response.json()
+            if isinstance(result, list) and len(result) > 0:
+                generated_text = result[0]['generated_text'].strip()
+            else:
+                generated_text = result.get('generated_text', UNSURE_RESPONSE).strip()
+            if generated_text.startswith(prefix):
+                generated_text = generated_text[len(prefix):].strip()
+            # Nothing is on screen yet, so a short reply can still be improved
+            if generated_text and len(generated_text) < MIN_RESPONSE_LENGTH:
+                generated_text = enhance_short_response(user_input, generated_text)
+            if generated_text:
+                yield generated_text
+            return
+
+        # Hold back the start of the reply until it's clear whether it echoes the prefix
+        head = ""
+        for line in response.iter_lines():
+            metrics.add_bytes(received=len(line))
+            if not line.startswith(b"data:"):
+                continue
+            event = json.loads(line[len(b"data:"):])
+            if event.get("error"):
+                # The server gave up part way, e.g. it ran out of memory or was restarted
+                raise RuntimeError(event["error"])
+            token = event.get("token") or {}
+            if token.get("special"):
+                continue
+            text = token.get("text", "")
+            if head is not None:
+                head = (head + text).lstrip()
+                if len(head) < len(prefix) and prefix.startswith(head):
+                    continue
+                text = head[len(prefix):].lstrip() if head.startswith(prefix) else head
+                head = None
+            if text:
+                yield text
+        if head:
+            yield head
+
+def _hedged_chunks(user_input, model_config, parameters, context=""):
+    """_hedged_response() as a stream of one chunk, yielding nothing on an error response."""
+    reply = _hedged_response(user_input, model_config, parameters, context)
+    if reply not in ERROR_RESPONSES:
+        yield reply
+
+def fallback_chain(model):
+    """The model followed by its fallbacks, in the order they are tried."""
+    chain = []
+    while model is not None and model not in chain:
+        chain.append(model)
+        model = MODELS[model].get("fallback")
+    return chain
+
+def response_cache_stats():
+    """Hit/miss counters of the response cache."""
+    return response_cache.get_cache().stats()
+
+def _generate_response(user_input, model_config, parameters, context=""):
+    """Call the chat model, enhancing the reply serially if it is too short."""
+    generated_text = _request_reply(user_input, model_config, parameters, context)
+    if generated_text in ERROR_RESPONSES:
+        return generated_text
+    
+    # If the response is too short, try to improve it
+    if len(generated_text) < MIN_RESPONSE_LENGTH:
+        return enhance_short_response(user_input, generated_text)
         
-        # Prepare a more conversational prompt for better responses
-        # The improved prompt engineering is key to getting better responses
-        prompt = f"""
+    return generated_text
+
+def build_prompt(user_input, context=""):
+    """The conversational prompt sent to the chat model for a user message and earlier turns."""
+    # Prepare a more conversational prompt for better responses
+    # The improved prompt engineering is key to getting better responses
+    history = f"\n{context}\n" if context else ""
+    return f"""
         You are a helpful, friendly, and knowledgeable assistant.
-        
+        {history}
         User: {user_input}
         
         Assistant:
         """
+
+@metrics.timed("llm")
+def _request_reply(user_input, model_config, parameters, context=""):
+    """Call the chat model and clean up its reply; returns an error response on failure."""
+    try:
+        chat_url = model_config["url"]
+        prompt = build_prompt(user_input, context)
         
         # Call the Hugging Face API with improved parameters
-        response = requests.post(
+        response = http_client.post(
             chat_url, 
-            headers=HEADERS, 
             json={
                 "inputs": prompt,
-                "parameters": {
-                    "max_length": max_length,
-                    "temperature": temperature,
-                    "top_p": 0.95,
-                    "top_k": 50,
-                    "repetition_penalty": 1.2,
-                    "do_sample": True
-                }
+                "parameters": parameters
             }
         )
         
@@ -76,28 +400,77 @@ def get_bot_response(user_input, model="google/flan-t5-small"):
             # Extract the generated text
             if isinstance(result, list) and len(result) > 0:
                 generated_text = result[0]['generated_text'].strip()
-                
-                # Clean up the response
-                if generated_text.startswith("Assistant:"):
-                    generated_text = generated_text[len("Assistant:"):].strip()
-                
-                # If the response is too short, try to improve it
-                if len(generated_text) < 20:
-                    return enhance_short_response(user_input, generated_text)
-                    
-                return generated_text
             else:
-                generated_text = result.get('generated_text', "I'm not sure how to respond to that.").strip()
-                if generated_text.startswith("Assistant:"):
-                    generated_text = generated_text[len("Assistant:"):].strip()
-                return generated_text
+                generated_text = result.get('generated_text', UNSURE_RESPONSE).strip()
+            
+            # Clean up the response
+            if generated_text.startswith("Assistant:"):
+                generated_text = generated_text[len("Assistant:"):].strip()
+            return generated_text
         else:
             print(f"API Error: {response.status_code} - {response.text}")  # Debugging
-            return "I'm having trouble thinking right now. Let's talk about something else."
+            return THINKING_ERROR_RESPONSE
     
     except Exception as e:
         print(f"Error in get_bot_response: {str(e)}")  # Debugging
-        return f"I'm having trouble connecting right now. Please try again in a moment."
+        return CONNECTION_ERROR_RESPONSE
+
+def _get_hedge_pool():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chat-hedge")
+    return _hedge_pool
+
+def _hedged_response(user_input, model_config, parameters, context="", hedge_after=None):
+    """
+    Race the primary model against the detailed flan-t5-xl request.
+
+    The primary request gets hedge_after seconds on its own. If it answers
+    well in that time no second request is made. Otherwise the detailed XL
+    request is fired and the first acceptable answer (see _is_decent) wins;
+    the loser is cancelled if it hasn't started, or its result is discarded.
+    If neither answer is acceptable, the longer one is used.
+    """
+    if hedge_after is None:
+        hedge_after = HEDGE_AFTER
+    pool = _get_hedge_pool()
+    primary = pool.submit(contextvars.copy_context().run, _request_reply, user_input, model_config, parameters,
+                          context)
+    pending = {primary}
+
+    done, _ = wait(pending, timeout=hedge_after)
+    if primary in done and _is_decent(primary.result()):
+        return primary.result()
+
+    print("Primary reply is slow or too short, hedging with the detailed model")
+    detailed = pool.submit(contextvars.copy_context().run, _request_detailed_answer, user_input)
+    pending.add(detailed)
+    fallback = None
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            result = future.result()
+            if result and _is_decent(result):
+                for loser in pending:
+                    loser.cancel()
+                return result
+            # The detailed request returns None when it fails; error responses only beat nothing
+            if result and (fallback is None or fallback in ERROR_RESPONSES
+                           or (result not in ERROR_RESPONSES and len(result) > len(fallback))):
+                fallback = result
+
+    return fallback or CONNECTION_ERROR_RESPONSE
+
+def _is_decent(text):
+    """Whether a reply is good enough to use without asking the detailed model."""
+    if text in ERROR_RESPONSES:
+        return False
+    if len(text) >= MIN_RESPONSE_LENGTH:
+        return True
+    return len(text) > 10 and not text.lower() in ["i don't know", "i'm not sure"]
 
 def enhance_short_response(user_input, original_response):
     """
@@ -111,10 +484,18 @@ def enhance_short_response(user_input, original_response):
         str: An enhanced response
     """
     # If the original response is decent, return it
-    if len(original_response) > 10 and not original_response.lower() in ["i don't know", "i'm not sure"]:
+    if _is_decent(original_response):
         return original_response
         
     # Otherwise, try a different approach with a more detailed prompt
+    enhanced_text = _request_detailed_answer(user_input)
+    if enhanced_text and len(enhanced_text) > len(original_response):
+        return enhanced_text
+    return original_response
+
+@metrics.timed("enhancement")
+def _request_detailed_answer(user_input):
+    """Ask flan-t5-xl for a detailed answer; returns None if the request fails."""
     try:
         # Get model configuration for a larger model
         model_config = MODELS.get("google/flan-t5-xl", MODELS["google/flan-t5-small"])
@@ -131,9 +512,8 @@ def enhance_short_response(user_input, original_response):
         """
         
         # Call the API with the enhanced prompt
-        response = requests.post(
+        response = http_client.post(
             chat_url, 
-            headers=HEADERS, 
             json={
                 "inputs": detailed_prompt,
                 "parameters": {
@@ -157,12 +537,9 @@ def enhance_short_response(user_input, original_response):
                     if enhanced_text.startswith(prefix):
                         enhanced_text = enhanced_text[len(prefix):].strip()
                 
-                return enhanced_text if len(enhanced_text) > len(original_response) else original_response
-            else:
-                return original_response
-        else:
-            return original_response
+                return enhanced_text
+        return None
             
     except Exception:
-        # If enhancement fails, return the original
-        return original_response
\ No newline at end of file
+        # If enhancement fails, the caller keeps the original
+        return None
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# Set CONVERSATION_DB to a SQLite file to keep conversations across restarts
+DB_PATH = os.getenv("CONVERSATION_DB")
+# Messages written per transaction at most, and how long the writer waits to fill a batch
+BATCH_SIZE = int(os.getenv("CONVERSATION_BATCH_SIZE", "256"))
+BATCH_INTERVAL = float(os.getenv("CONVERSATION_BATCH_INTERVAL", "0.05"))
+# Rows read per query when exporting
+EXPORT_PAGE = 5000
+
+
+def audio_digest(audio):
+    """Content address of an audio clip; identical clips are stored once."""
+    return hashlib.sha256(audio).hexdigest()
+
+
+class ConversationStore(ABC):
+    """
+    Where conversations are kept between sessions.
+
+    A backend implements the methods below; messages come back as dicts
+    with id, session_id, role, content, audio (a sha256 or None), created
+    and meta. Ids increase in the order messages were appended, so they
+    double as pagination cursors.
+    """
+
+    @abstractmethod
+    def append(self, session_id, role, content, audio=None, meta=None):
+        """Queue a message for writing and return without waiting for it."""
+
+    @abstractmethod
+    def flush(self, timeout=None):
+        """
+        Block until every message appended so far is written; False if the
+        timeout passed first or the store is closed.
+        """
+
+    @abstractmethod
+    def load(self, session_id, limit=50, before=None, skip=0):
+        """
+        The latest limit messages of a session, oldest first: older than id
+        before if given, and after skipping the skip newest.
+        """
+
+    @abstractmethod
+    def audio(self, digest):
+        """Bytes of a stored clip, or None."""
+
+    @abstractmethod
+    def sessions(self, limit=50):
+        """Most recently active sessions as dicts of session_id, created, updated and messages."""
+
+    @abstractmethod
+    def export(self, out, session_id=None, since=None):
+        """Write messages as JSON lines to a text file object and return how many."""
+
+    def close(self):
+        pass
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Conversation store on a SQLite database in WAL mode.
+
+    Appends go to a queue and a writer thread commits them in batches of up
+    to BATCH_SIZE, so a turn never waits on the disk. Audio is stored once
+    per distinct clip in its own table and messages refer to it by sha256.
+    Reads use a second connection; WAL lets them run alongside the writer.
+    """
+
+    def __init__(self, path=DB_PATH, batch_size=BATCH_SIZE, batch_interval=BATCH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._queue = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader_lock = threading.Lock()
+        self._reader.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                audio TEXT,
+                created REAL NOT NULL,
+                meta TEXT
+            );
+            CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);
+            CREATE TABLE IF NOT EXISTS audio (sha256 TEXT PRIMARY KEY, data BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                messages INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+        """)
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-store", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints rather than every commit, which WAL makes safe against corruption
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def append(self, session_id, role, content, audio=None, meta=None):
+        self._queue.put((session_id, role, content, audio, meta, time.time()))
+
+    def flush(self, timeout=None):
+        done = threading.Event()
+        # Nothing would ever set the event once the writer has stopped
+        with self._close_lock:
+            if self._closed:
+                return False
+            self._queue.put(done)
+        return done.wait(timeout)
+
+    def _write_loop(self):
+        db = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._write(db, [item for item in batch if isinstance(item, tuple)])
+            except Exception as e:
+                print(f"Error writing conversations: {str(e)}")
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            # close() queues None to stop the writer
+            if any(item is None for item in batch):
+                db.close()
+                return
+
+    def _write(self, db, records):
+        if not records:
+            return
+        messages = []
+        clips = {}
+        sessions = {}
+        for session_id, role, content, audio, meta, created in records:
+            digest = None
+            if audio:
+                digest = audio_digest(audio)
+                clips[digest] = audio
+            messages.append((session_id, role, content, digest, created,
+                             json.dumps(meta) if meta is not None else None))
+            first, _, count = sessions.get(session_id, (created, created, 0))
+            sessions[session_id] = (first, created, count + 1)
+        with db:
+            db.executemany("INSERT OR IGNORE INTO audio (sha256, data) VALUES (?, ?)", clips.items())
+            db.executemany(
+                "INSERT INTO messages (session_id, role, content, audio, created, meta) VALUES (?, ?, ?, ?, ?, ?)",
+                messages,
+            )
+            db.executemany(
+                "INSERT INTO sessions (session_id, created, updated, messages) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET updated = excluded.updated, "
+                "messages = messages + excluded.messages",
+                [(session_id, *counts) for session_id, counts in sessions.items()],
+            )
+
+    @staticmethod
+    def _message(row):
+        message_id, session_id, role, content, audio, created, meta = row
+        return {"id": message_id, "session_id": session_id, "role": role, "content": content,
+                "audio": audio, "created": created, "meta": json.loads(meta) if meta else None}
+
+    def load(self, session_id, limit=50, before=None, skip=0):
+        with self._reader_lock:
+            rows = self._reader.execute(
+                "SELECT id, session_id, role, content, audio, created, meta FROM messages "
+                "WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                (session_id, before if before is not None else 2 ** 63 - 1, limit, skip),
+            ).fetchall()
+        return [self._message(row) for row in reversed(rows)]
+
+    def audio(self, digest):
+        with self._reader_lock:
+            row = self._reader.execute("SELECT data FROM audio WHERE sha256 = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def sessions(self, limit=50):
+        with self._reader_lock:
+            rows = self._reader.execute(
+                "SELECT session_id, created, updated, messages FROM sessions ORDER BY updated DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(zip(("session_id", "created", "updated", "messages"), row)) for row in rows]
+
+    def export(self, out, session_id=None, since=None):
+        """
+        Write messages as JSON lines, oldest first.
+
+        Rows are read EXPORT_PAGE at a time by id on a connection of its
+        own, so memory stays flat however many turns there are and the app
+        keeps reading and writing while an export runs.
+        """
+        db = self._connect()
+        query = "SELECT id, session_id, role, content, audio, created, meta FROM messages WHERE id > ?"
+        params = []
+        if session_id is not None:
+            query += " AND session_id = ?"
+            params.append(session_id)
+        if since is not None:
+            query += " AND created >= ?"
+            params.append(since)
+        query += " ORDER BY id LIMIT ?"
+        count = 0
+        last_id = 0
+        try:
+            while True:
+                rows = db.execute(query, (last_id, *params, EXPORT_PAGE)).fetchall()
+                if not rows:
+                    break
+                out.writelines(json.dumps(self._message(row)) + "\n" for row in rows)
+                count += len(rows)
+                last_id = rows[-1][0]
+        finally:
+            db.close()
+        return count
+
+    def close(self):
+        """Write what is queued and stop the writer."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._writer.join()
+        with self._reader_lock:
+            self._reader.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """Return the process-wide conversation store, or None if CONVERSATION_DB isn't set."""
+    global _store
+    if _store is None and DB_PATH:
+        with _store_lock:
+            if _store is None:
+                _store = SQLiteConversationStore()
+    return _store
@@ -0,0 +1,229 @@
+"""
+Compact on-disk corpus of PDF page text.
+
+A corpus directory holds one subdirectory per ingest run (a generation),
+each with three files:
+
+    text.bin       UTF-8 text of every page, concatenated
+    offsets.npy    int64 byte offsets into text.bin, one per page plus the end
+    manifest.json  per document: path, sha256, mtime_ns, size, first_page, pages
+
+and a CURRENT file naming the generation to read. A generation is never
+modified once CURRENT points at it, and CURRENT is replaced atomically, so a
+reader always gets the three files of one generation together.
+
+Both binary files are memory-mapped when read, so opening a corpus of
+thousands of resumes costs nothing until pages are actually touched.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from utils.resume_parser import file_digest, iter_pages
+
+TEXT_FILE = "text.bin"
+OFFSETS_FILE = "offsets.npy"
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+GENERATION_PREFIX = "gen-"
+
+
+def current_generation(directory):
+    """Name of the generation CURRENT points at, or None if there isn't one."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _generations(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if name.startswith(GENERATION_PREFIX) and os.path.isdir(os.path.join(directory, name)))
+
+
+def find_pdfs(root):
+    """Every PDF under root, sorted so corpus page order is stable."""
+    paths = []
+    for directory, _, names in os.walk(root):
+        paths += [os.path.join(directory, name) for name in names if name.lower().endswith(".pdf")]
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def _extract_to_part(path, part_path):
+    """
+    Worker: stream a PDF's pages into part_path and return the byte length of each.
+
+    Runs in a pool process, so only one page of one document is held in
+    memory per worker.
+    """
+    lengths = []
+    with open(part_path, "wb") as out:
+        for text in iter_pages(path):
+            data = text.encode("utf-8")
+            out.write(data)
+            lengths.append(len(data))
+    return lengths
+
+
+class Corpus:
+    """Read-only view of a corpus directory; pages are sliced from the memory-mapped blob."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.generation = current_generation(directory)
+        if self.generation is None:
+            raise FileNotFoundError(f"No corpus in {directory}")
+        path = os.path.join(directory, self.generation)
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.documents = json.load(f)["documents"]
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        text_path = os.path.join(path, TEXT_FILE)
+        # np.memmap can't map an empty file
+        if os.path.getsize(text_path):
+            self.text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            self.text = np.zeros(0, dtype=np.uint8)
+
+    @classmethod
+    def exists(cls, directory):
+        return current_generation(directory) is not None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def page(self, index):
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return self.text[start:end].tobytes().decode("utf-8")
+
+    def page_bytes(self, start_page, end_page):
+        """Raw UTF-8 bytes of a run of pages, for copying into a new corpus."""
+        return self.text[int(self.offsets[start_page]):int(self.offsets[end_page])]
+
+    def document_text(self, document):
+        """Text of one manifest entry, its pages joined."""
+        first = document["first_page"]
+        return "".join(self.page(i) for i in range(first, first + document["pages"]))
+
+    def iter_documents(self):
+        """Yield (manifest entry, text) per document."""
+        for document in self.documents:
+            yield document, self.document_text(document)
+
+
+def ingest(source, output, workers=None):
+    """
+    Build or update the corpus in output from the PDFs under source.
+
+    Files whose mtime and size match the existing manifest, or whose content
+    hash matches a document already in it, are copied over from the old
+    corpus without being parsed. The rest are parsed across a process pool,
+    each worker streaming pages into its own part file. The new corpus is
+    written as a new generation and published by atomically replacing
+    CURRENT; the previous generation is kept for readers that are still
+    opening it, and older ones are removed.
+
+    Args:
+        source (str): Directory searched recursively for PDFs
+        output (str): Corpus directory, created if missing
+        workers (int): Pool processes; defaults to the CPU count
+
+    Returns:
+        dict: Counts of documents reused, parsed and failed, pages and seconds
+    """
+    started = time.perf_counter()
+    os.makedirs(output, exist_ok=True)
+    old = Corpus(output) if Corpus.exists(output) else None
+    old_by_path = {doc["path"]: doc for doc in old.documents} if old else {}
+    old_by_digest = {doc["sha256"]: doc for doc in old.documents} if old else {}
+
+    # Decide per file whether its pages can be reused
+    plan = []
+    for path in find_pdfs(source):
+        stat = os.stat(path)
+        entry = {"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        known = old_by_path.get(path)
+        if known and (known["mtime_ns"], known["size"]) == (stat.st_mtime_ns, stat.st_size):
+            plan.append((entry, known))
+            continue
+        entry["sha256"] = file_digest(path)
+        plan.append((entry, old_by_digest.get(entry["sha256"])))
+
+    stats = {"documents": len(plan), "reused": 0, "parsed": 0, "failed": 0, "pages": 0}
+    scratch = tempfile.mkdtemp(dir=output, prefix=".build-")
+    try:
+        lengths = {}
+        to_parse = [entry for entry, reused in plan if reused is None]
+        if to_parse:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(_extract_to_part, entry["path"], os.path.join(scratch, f"{i}.part")): i
+                    for i, entry in enumerate(to_parse)
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        lengths[i] = future.result()
+                    except Exception as e:
+                        print(f"Skipping {to_parse[i]['path']}: {str(e)}")
+                        stats["failed"] += 1
+
+        # Stream every document's pages into the new blob in source order
+        documents = []
+        offsets = [0]
+        parse_index = 0
+        with open(os.path.join(scratch, TEXT_FILE), "wb") as blob:
+            for entry, reused in plan:
+                if reused is not None:
+                    first = reused["first_page"]
+                    page_ends = old.offsets[first + 1:first + reused["pages"] + 1] - old.offsets[first]
+                    blob.write(old.page_bytes(first, first + reused["pages"]).tobytes())
+                    entry["sha256"] = reused["sha256"]
+                    page_lengths = np.diff(np.concatenate([[0], page_ends])).tolist()
+                    stats["reused"] += 1
+                else:
+                    i = parse_index
+                    parse_index += 1
+                    if i not in lengths:
+                        continue
+                    with open(os.path.join(scratch, f"{i}.part"), "rb") as part:
+                        shutil.copyfileobj(part, blob)
+                    page_lengths = lengths[i]
+                    stats["parsed"] += 1
+                entry["first_page"] = len(offsets) - 1
+                entry["pages"] = len(page_lengths)
+                for length in page_lengths:
+                    offsets.append(offsets[-1] + int(length))
+                documents.append(entry)
+
+        np.save(os.path.join(scratch, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+        with open(os.path.join(scratch, MANIFEST_FILE), "w") as f:
+            json.dump({"documents": documents}, f)
+        for name in os.listdir(scratch):
+            if name.endswith(".part"):
+                os.remove(os.path.join(scratch, name))
+
+        # The finished generation gets its final name, then CURRENT is swapped to it
+        existing = _generations(output)
+        number = int(existing[-1][len(GENERATION_PREFIX):]) + 1 if existing else 1
+        generation = f"{GENERATION_PREFIX}{number:06d}"
+        os.rename(scratch, os.path.join(output, generation))
+        pointer = os.path.join(output, f".{CURRENT_FILE}.tmp")
+        with open(pointer, "w") as f:
+            f.write(generation)
+        os.replace(pointer, os.path.join(output, CURRENT_FILE))
+    finally:
+        if os.path.isdir(scratch):
+            shutil.rmtree(scratch)
+
+    # Keep the generation readers may have just looked up; open maps of older ones stay valid after removal
+    del old
+    for name in _generations(output)[:-2]:
+        shutil.rmtree(os.path.join(output, name), ignore_errors=True)
+
+    stats["pages"] = len(offsets) - 1
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
@@ -0,0 +1,136 @@
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import requests
+from requests.adapters import HTTPAdapter
+from utils import metrics, resilience
+from utils.single_flight import SingleFlight, payload_key
+
+HF_API_KEY = os.getenv("HF_API_KEY")
+
+# Point this at a local stand-in (see benchmarks/mock_server.py) to run without the network
+HF_API_BASE = os.getenv("HF_API_BASE", "https://api-inference.huggingface.co").rstrip("/")
+
+# Timeouts in seconds, as a (connect, read) pair for requests
+CONNECT_TIMEOUT = float(os.getenv("HF_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HF_READ_TIMEOUT", "60"))
+
+# Connections kept alive per endpoint; one per concurrent Streamlit session is plenty
+DEFAULT_POOL_SIZE = int(os.getenv("HF_POOL_SIZE", "10"))
+
+_session = None
+_session_lock = threading.Lock()
+_endpoints = {}
+_in_flight = SingleFlight()
+
+
+def _make_adapter(pool_size):
+    # pool_block=False lets a burst open extra short-lived connections instead of queueing
+    return HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+
+
+def get_session():
+    """Return the process-wide keep-alive session used for all inference calls."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.headers.update({"Authorization": f"Bearer {HF_API_KEY}"})
+                session.mount("https://", _make_adapter(DEFAULT_POOL_SIZE))
+                session.mount("http://", _make_adapter(DEFAULT_POOL_SIZE))
+                for url, pool_size in _endpoints.items():
+                    session.mount(url, _make_adapter(pool_size))
+                _session = session
+    return _session
+
+
+def register_endpoint(url, pool_size=None):
+    """
+    Give an endpoint its own connection pool.
+
+    Args:
+        url (str): Endpoint URL; requests matches adapters by longest prefix
+        pool_size (int): Connections to keep alive for this endpoint
+    """
+    pool_size = pool_size or DEFAULT_POOL_SIZE
+    with _session_lock:
+        _endpoints[url] = pool_size
+        if _session is not None:
+            _session.mount(url, _make_adapter(pool_size))
+
+
+def post(url, timeout=None, retry=True, coalesce=True, **kwargs):
+    """
+    POST to an inference endpoint over the shared session.
+
+    Cold-start 503s, rate limits and dropped connections are retried with
+    backoff inside the current deadline, behind the endpoint's circuit
+    breaker (see utils/resilience.py). Identical requests made while one is
+    already in flight share its response instead of calling the endpoint
+    again.
+
+    Args:
+        url (str): Endpoint URL
+        timeout (float or tuple): Overrides the configured (connect, read) timeouts
+        retry (bool): Set to False to make a single attempt
+        coalesce (bool): Set to False to always make a call of its own
+        **kwargs: Passed through to requests (json, data, files, headers...)
+
+    Returns:
+        requests.Response: The endpoint's response
+
+    Raises:
+        resilience.CircuitOpenError: If the endpoint is failing and the breaker is open
+    """
+    def send(time_left):
+        attempt_timeout = timeout
+        if attempt_timeout is None:
+            # Never wait on a read past the deadline
+            attempt_timeout = (CONNECT_TIMEOUT, max(1.0, min(READ_TIMEOUT, time_left)))
+        response = get_session().post(url, timeout=attempt_timeout, **kwargs)
+        body = response.request.body
+        metrics.add_bytes(sent=len(body) if body else 0, received=len(response.content))
+        return response
+
+    def call():
+        return resilience.call(url, send, max_attempts=resilience.MAX_ATTEMPTS if retry else 1)
+
+    if not coalesce:
+        return call()
+    try:
+        response, shared = _in_flight.do(payload_key(url, **kwargs), call, timeout=resilience.remaining())
+    except FutureTimeoutError:
+        raise requests.exceptions.Timeout(f"Timed out waiting for a shared request to {url}")
+    metrics.cache_event("single_flight", shared)
+    return response
+
+
+def post_stream(url, timeout=None, **kwargs):
+    """
+    POST to an inference endpoint and return the response unread, for streaming.
+
+    Retries and the circuit breaker apply until the response headers arrive;
+    identical requests are not coalesced since the body can only be read
+    once. The caller reads the body (e.g. with iter_lines()), records the
+    received bytes and closes the response.
+
+    Args:
+        url (str): Endpoint URL
+        timeout (float or tuple): Overrides the configured (connect, read) timeouts;
+            the read timeout applies between chunks
+        **kwargs: Passed through to requests (json, data, headers...)
+
+    Returns:
+        requests.Response: The endpoint's response, with stream=True
+    """
+    def send(time_left):
+        attempt_timeout = timeout
+        if attempt_timeout is None:
+            attempt_timeout = (CONNECT_TIMEOUT, max(1.0, min(READ_TIMEOUT, time_left)))
+        response = get_session().post(url, timeout=attempt_timeout, stream=True, **kwargs)
+        body = response.request.body
+        metrics.add_bytes(sent=len(body) if body else 0)
+        return response
+
+    return resilience.call(url, send)
@@ -0,0 +1,220 @@
+import os
+import re
+import threading
+import time
+import numpy as np
+from utils.corpus import Corpus, current_generation
+from utils.memory import estimate_tokens
+from utils.resume_parser import extract_text
+
+# Comma-separated PDF files or directories of PDFs the bot answers from
+KNOWLEDGE_PATHS = os.getenv("KNOWLEDGE_PATHS", "resume")
+# A corpus built by ingest.py, for large document sets; used instead of KNOWLEDGE_PATHS
+KNOWLEDGE_CORPUS = os.getenv("KNOWLEDGE_CORPUS")
+# Chunks put into a prompt at most
+TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "3"))
+# Chunks scoring below this fraction of the best score the query could get are dropped
+MIN_SCORE = float(os.getenv("KNOWLEDGE_MIN_SCORE", "0.15"))
+
+CHUNK_WORDS = 80
+CHUNK_OVERLAP = 20
+# Seconds between checks of the source files for changes
+REFRESH_INTERVAL = 5.0
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*[+#]*")
+
+# Function words that would otherwise match every chunk; only dropped from queries
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her
+here hers him his how i if in into is it its just me more most my no nor not now of off on once only
+or other our ours out over own same she should so some such than that the their theirs them then
+there these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself tell know like please
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased word tokens; keeps terms like c++, c# and node.js whole."""
+    return _TOKEN.findall(text.lower())
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Split text into overlapping windows of chunk_words words."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, chunk_words - overlap)
+    return [" ".join(words[start:start + chunk_words])
+            for start in range(0, max(1, len(words) - overlap), step)]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed list of chunks.
+
+    The per-term BM25 weight of every chunk is computed once into a sparse
+    chunks x terms matrix (CSC, so a query only touches the columns of its
+    own terms). Scoring a query is a column slice and a row sum.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        # scipy.sparse is only needed once there is something to index
+        import scipy.sparse as sp
+        self.chunks = list(chunks)
+        self.vocabulary = {}
+        rows, cols, counts = [], [], []
+        lengths = np.zeros(len(self.chunks))
+        for row, chunk in enumerate(self.chunks):
+            tokens = tokenize(chunk)
+            lengths[row] = len(tokens)
+            term_counts = {}
+            for token in tokens:
+                column = self.vocabulary.setdefault(token, len(self.vocabulary))
+                term_counts[column] = term_counts.get(column, 0) + 1
+            rows += [row] * len(term_counts)
+            cols += list(term_counts)
+            counts += list(term_counts.values())
+
+        shape = (len(self.chunks), len(self.vocabulary))
+        tf = sp.csr_matrix((np.array(counts, dtype=np.float64), (rows, cols)), shape=shape)
+        document_frequency = np.bincount(np.asarray(cols, dtype=np.int64), minlength=shape[1])
+        idf = np.log1p((shape[0] - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = lengths.mean() if len(lengths) else 0.0
+        norm = k1 * (1 - b + b * lengths / average_length) if average_length else np.full(shape[0], k1)
+
+        # BM25 weight per stored (chunk, term) entry, with the chunk's length norm per row
+        weights = tf.copy()
+        row_norm = np.repeat(norm, np.diff(tf.indptr))
+        weights.data = weights.data * (k1 + 1) / (weights.data + row_norm) * idf[tf.indices]
+        self.weights = weights.tocsc()
+        # Best weight a term can reach (tf -> infinity); bounds a query's attainable score
+        self.max_weights = idf * (k1 + 1)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query, k=TOP_K, min_score=MIN_SCORE):
+        """
+        Return up to k (score, chunk) pairs for query, best first.
+
+        Stopwords are ignored, and chunks scoring below min_score times the
+        best score the query's indexed terms could reach together are left
+        out, so a passing mention of one of several terms doesn't count.
+        """
+        terms = {token for token in tokenize(query) if token not in STOPWORDS}
+        columns = sorted({self.vocabulary[token] for token in terms if token in self.vocabulary})
+        if not columns:
+            return []
+        scores = np.asarray(self.weights[:, columns].sum(axis=1)).ravel()
+        scores[scores < min_score * float(self.max_weights[columns].sum())] = 0
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.chunks[i]) for i in top]
+
+
+def _pdf_paths(spec):
+    paths = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        if os.path.isdir(entry):
+            paths += sorted(os.path.join(entry, name) for name in os.listdir(entry)
+                            if name.lower().endswith(".pdf"))
+        elif os.path.isfile(entry):
+            paths.append(entry)
+    return paths
+
+
+class KnowledgeBase:
+    """
+    Documents the bot can quote from, with a BM25 index over their chunks.
+
+    Source PDFs are re-checked at most every REFRESH_INTERVAL seconds; the
+    index is rebuilt only when a file's content hash changes, and unchanged
+    files are never parsed again (see resume_parser.extract_text). With a
+    corpus directory from ingest.py the text is read from the corpus
+    instead, and the index is rebuilt when the corpus is re-ingested.
+    """
+
+    def __init__(self, paths=KNOWLEDGE_PATHS, corpus=KNOWLEDGE_CORPUS):
+        self.paths = paths
+        self.corpus = corpus
+        # Built on the first refresh, so creating a knowledge base is free
+        self.index = None
+        self._digests = {}
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Re-read changed source files and rebuild the index if anything changed."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._checked is not None and now - self._checked < REFRESH_INTERVAL:
+                return
+            self._checked = now
+            if self.corpus:
+                texts, digests = self._read_corpus()
+            else:
+                texts, digests = self._read_pdfs()
+            if digests == self._digests:
+                return
+            chunks = [chunk for path in sorted(texts) for chunk in chunk_text(texts[path])]
+            self.index = BM25Index(chunks)
+            self._digests = digests
+            print(f"Knowledge base indexed {len(chunks)} chunks from {len(texts)} documents")
+
+    def _read_pdfs(self):
+        texts = {}
+        digests = {}
+        for path in _pdf_paths(self.paths):
+            try:
+                texts[path], digests[path] = extract_text(path)
+            except Exception as e:
+                print(f"Skipping {path} for the knowledge base: {str(e)}")
+        return texts, digests
+
+    def _read_corpus(self):
+        # Each ingest publishes a new generation, so its name marks a new corpus
+        version = current_generation(self.corpus)
+        if version is None:
+            return {}, {}
+        if self._digests.get(self.corpus) == version:
+            return None, self._digests
+        corpus = Corpus(self.corpus)
+        texts = {document["path"]: text for document, text in corpus.iter_documents()}
+        return texts, {self.corpus: corpus.generation}
+
+    def search(self, query, k=TOP_K):
+        self.refresh()
+        return self.index.search(query, k) if self.index is not None else []
+
+    def context(self, query, budget, k=TOP_K):
+        """The best matching chunks as prompt text within budget tokens, or "" if none match."""
+        lines = []
+        used = estimate_tokens("Relevant information:")
+        for _, chunk in self.search(query, k):
+            line = f"- {chunk}"
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        if not lines:
+            return ""
+        return "\n".join(["Relevant information:"] + lines)
+
+
+_knowledge_base = None
+_knowledge_base_lock = threading.Lock()
+
+
+def get_knowledge_base():
+    """Return the process-wide knowledge base over KNOWLEDGE_PATHS."""
+    global _knowledge_base
+    if _knowledge_base is None:
+        with _knowledge_base_lock:
+            if _knowledge_base is None:
+                _knowledge_base = KnowledgeBase()
+    return _knowledge_base
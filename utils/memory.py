@@ -0,0 +1,95 @@
+import os
+import re
+import threading
+from collections import deque
+
+# Turns kept verbatim per conversation; older ones are folded into the summary
+MAX_TURNS = int(os.getenv("MEMORY_TURNS", "12"))
+# Topics of folded turns kept in the summary
+MAX_TOPICS = 6
+TOPIC_CHARS = 60
+
+# History may take up to this multiple of a model's max_length in prompt tokens
+BUDGET_RATIO = 2
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text):
+    """Rough T5 token count: about four characters per sentencepiece token."""
+    return len(text) // 4 + 1
+
+
+def history_budget(model_config):
+    """Prompt tokens a model's conversation history may use, from its max_length."""
+    return model_config["max_length"] * BUDGET_RATIO
+
+
+def _topic(user_input):
+    # The first sentence of a question is usually enough to say what it was about
+    topic = _SENTENCE_END.split(user_input.strip(), 1)[0]
+    if len(topic) > TOPIC_CHARS:
+        topic = topic[:TOPIC_CHARS].rsplit(" ", 1)[0] + "..."
+    return topic
+
+
+class ConversationMemory:
+    """
+    Bounded memory of one conversation for building prompts.
+
+    The latest max_turns exchanges are kept verbatim in a ring buffer. An
+    exchange pushed out of the buffer is reduced to a short topic line, and
+    only the latest few topics are kept, so both memory use and the prompt
+    stay bounded however long the session runs.
+    """
+
+    def __init__(self, max_turns=MAX_TURNS, max_topics=MAX_TOPICS):
+        self.turns = deque(maxlen=max_turns)
+        self.topics = deque(maxlen=max_topics)
+        self._lock = threading.Lock()
+
+    def add(self, user_input, bot_response):
+        with self._lock:
+            if len(self.turns) == self.turns.maxlen:
+                self.topics.append(_topic(self.turns[0][0]))
+            self.turns.append((user_input.strip(), bot_response.strip()))
+
+    def clear(self):
+        with self._lock:
+            self.turns.clear()
+            self.topics.clear()
+
+    def __len__(self):
+        return len(self.turns)
+
+    def context(self, budget):
+        """
+        Earlier conversation as prompt text within budget tokens.
+
+        The most recent exchanges are included first; exchanges that don't
+        fit are dropped, and a line listing earlier topics is added if there
+        is room left.
+        """
+        with self._lock:
+            turns = list(self.turns)
+            topics = list(self.topics)
+
+        lines = []
+        used = 0
+        included = 0
+        for user_input, bot_response in reversed(turns):
+            exchange = f"User: {user_input}\nAssistant: {bot_response}"
+            cost = estimate_tokens(exchange)
+            if used + cost > budget:
+                break
+            lines.insert(0, exchange)
+            used += cost
+            included += 1
+
+        # Topics of turns that were folded or didn't fit, oldest first
+        earlier = topics + [_topic(user_input) for user_input, _ in turns[:len(turns) - included]]
+        if earlier:
+            summary = f"Earlier the user asked about: {'; '.join(earlier[-MAX_TOPICS:])}"
+            if used + estimate_tokens(summary) <= budget:
+                lines.insert(0, summary)
+        return "\n".join(lines)
@@ -0,0 +1,250 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stages timed for every turn, in pipeline order
+STAGES = ("capture", "encode", "stt", "first_token", "llm", "enhancement", "tts", "playback_start")
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger("voicebot.metrics")
+if os.getenv("METRICS_LOG", "1") == "1" and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_current_trace = contextvars.ContextVar("voicebot_trace", default=None)
+
+
+class TurnTrace:
+    """Timings, byte counts and cache events collected for one conversational turn."""
+
+    def __init__(self, session_id=None):
+        self.turn_id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.started = time.time()
+        self.stages = {}
+        self.bytes = {"sent": 0, "received": 0}
+        self.cache = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            # A stage can run more than once per turn, e.g. one TTS request per sentence
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_bytes(self, sent=0, received=0):
+        with self._lock:
+            self.bytes["sent"] += sent
+            self.bytes["received"] += received
+
+    def cache_event(self, cache, hit):
+        with self._lock:
+            counts = self.cache.setdefault(cache, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "turn_id": self.turn_id,
+                "session_id": self.session_id,
+                "started": self.started,
+                "stages": {stage: round(seconds, 4) for stage, seconds in self.stages.items()},
+                "bytes": dict(self.bytes),
+                "cache": {name: dict(counts) for name, counts in self.cache.items()},
+            }
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class _Registry:
+    """Process-wide aggregates exported in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._bytes = {"sent": 0, "received": 0}
+        self._cache = {}
+        self._turns = 0
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._stages.setdefault(stage, _Histogram()).observe(seconds)
+
+    def add_bytes(self, sent, received):
+        with self._lock:
+            self._bytes["sent"] += sent
+            self._bytes["received"] += received
+
+    def cache_event(self, cache, hit):
+        with self._lock:
+            key = (cache, "hit" if hit else "miss")
+            self._cache[key] = self._cache.get(key, 0) + 1
+
+    def turn_finished(self):
+        with self._lock:
+            self._turns += 1
+
+    def render(self):
+        with self._lock:
+            lines = [
+                "# HELP voicebot_stage_seconds Time spent in each stage of a turn.",
+                "# TYPE voicebot_stage_seconds histogram",
+            ]
+            for stage, histogram in sorted(self._stages.items()):
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    lines.append(f'voicebot_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'voicebot_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'voicebot_stage_seconds_sum{{stage="{stage}"}} {histogram.total}')
+                lines.append(f'voicebot_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            lines += [
+                "# HELP voicebot_bytes_total Bytes exchanged with inference endpoints.",
+                "# TYPE voicebot_bytes_total counter",
+            ]
+            for direction, total in sorted(self._bytes.items()):
+                lines.append(f'voicebot_bytes_total{{direction="{direction}"}} {total}')
+            lines += [
+                "# HELP voicebot_cache_events_total Cache lookups by cache and result.",
+                "# TYPE voicebot_cache_events_total counter",
+            ]
+            for (cache, result), total in sorted(self._cache.items()):
+                lines.append(f'voicebot_cache_events_total{{cache="{cache}",result="{result}"}} {total}')
+            lines += [
+                "# HELP voicebot_turns_total Completed turns.",
+                "# TYPE voicebot_turns_total counter",
+                f"voicebot_turns_total {self._turns}",
+            ]
+            return "\n".join(lines) + "\n"
+
+
+registry = _Registry()
+
+
+def start_turn(session_id=None):
+    """Create a trace for a new turn and make it current in this context."""
+    trace = TurnTrace(session_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace):
+    """Make trace current for the duration of the block, e.g. inside a worker thread."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def context_with(trace):
+    """A copy of the current context with trace made current, for Context.run in other threads."""
+    context = contextvars.copy_context()
+    context.run(_current_trace.set, trace)
+    return context
+
+
+def observe(stage, seconds, trace=None):
+    """Record a stage duration on the trace (defaults to the current one) and the process totals."""
+    trace = trace or current_trace()
+    if trace is not None:
+        trace.record(stage, seconds)
+    registry.observe(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block as one stage of the current turn."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def add_bytes(sent=0, received=0):
+    trace = current_trace()
+    if trace is not None:
+        trace.add_bytes(sent, received)
+    registry.add_bytes(sent, received)
+
+
+def cache_event(cache, hit):
+    trace = current_trace()
+    if trace is not None:
+        trace.cache_event(cache, hit)
+    registry.cache_event(cache, hit)
+
+
+def finish_turn(trace):
+    """Emit the turn as one structured log line and count it."""
+    registry.turn_finished()
+    logger.info(json.dumps({"event": "turn", **trace.to_dict()}))
+
+
+def log_event(event, trace=None, **fields):
+    """Emit a structured log line tied to a turn, for stages that finish after the turn, like playback."""
+    record = {"event": event, **fields}
+    if trace is not None:
+        record["turn_id"] = trace.turn_id
+    logger.info(json.dumps(record))
+
+
+def render_prometheus():
+    """All process-wide metrics in Prometheus text exposition format."""
+    return registry.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port):
+    """Serve /metrics on port from a background thread; later calls reuse the running server."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            print(f"Metrics available at http://0.0.0.0:{port}/metrics")
+    return _server
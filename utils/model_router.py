@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# Pass this as the model to let the router pick one per request
+AUTO_MODEL = "auto"
+
+# Target p95 seconds for a chat reply; models whose recent p95 exceeds it are skipped
+LATENCY_SLO = float(os.getenv("ROUTER_LATENCY_SLO", "4"))
+# Models failing more often than this recently are skipped
+MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.2"))
+# With this many chat requests in flight every request goes to the small model
+LOAD_LIMIT = int(os.getenv("ROUTER_LOAD_LIMIT", "8"))
+
+# Samples older than this are forgotten, so a model that was slow once gets another chance
+WINDOW_SECONDS = 300
+WINDOW_SIZE = 100
+# Fewer samples than this and a model is assumed to fit the SLO
+MIN_SAMPLES = 3
+
+# Inputs shorter than this are answered well enough by the small model
+SHORT_INPUT_CHARS = 24
+
+SMALL_MODEL = "google/flan-t5-small"
+# Preferred models, best first; the small model is always the last resort
+ENGLISH_PREFERENCE = ("google/flan-t5-xl", SMALL_MODEL)
+MULTILINGUAL_PREFERENCE = ("google/mt5-large", SMALL_MODEL)
+
+
+class ModelStats:
+    """Rolling latency and error statistics for one model over a time window."""
+
+    def __init__(self, window_seconds=WINDOW_SECONDS, size=WINDOW_SIZE):
+        self.window_seconds = window_seconds
+        self.samples = deque(maxlen=size)
+
+    def record(self, seconds, ok):
+        self.samples.append((time.monotonic(), seconds, ok))
+
+    def _recent(self):
+        cutoff = time.monotonic() - self.window_seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return list(self.samples)
+
+    def summary(self):
+        recent = self._recent()
+        if not recent:
+            return {"count": 0, "p50": None, "p95": None, "error_rate": 0.0}
+        latencies = np.array([seconds for _, seconds, ok in recent if ok] or [0.0])
+        errors = sum(not ok for _, _, ok in recent)
+        return {
+            "count": len(recent),
+            "p50": round(float(np.percentile(latencies, 50)), 3),
+            "p95": round(float(np.percentile(latencies, 95)), 3),
+            "error_rate": round(errors / len(recent), 3),
+        }
+
+
+class ModelRouter:
+    """
+    Picks a chat model per request for the "Auto" setting.
+
+    Short inputs go to the small model. Longer ones go to the best model in
+    the preference list (mt5-large for mostly non-ASCII text, flan-t5-xl
+    otherwise) whose recent p95 latency fits LATENCY_SLO and whose error
+    rate is below MAX_ERROR_RATE. When LOAD_LIMIT chat requests are already
+    in flight everything degrades to the small model.
+    """
+
+    def __init__(self, slo=LATENCY_SLO, max_error_rate=MAX_ERROR_RATE, load_limit=LOAD_LIMIT):
+        self.slo = slo
+        self.max_error_rate = max_error_rate
+        self.load_limit = load_limit
+        self._stats = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def started(self, model):
+        with self._lock:
+            self._in_flight[model] = self._in_flight.get(model, 0) + 1
+
+    def finished(self, model, seconds, ok):
+        with self._lock:
+            self._in_flight[model] = max(0, self._in_flight.get(model, 0) - 1)
+            self._stats.setdefault(model, ModelStats()).record(seconds, ok)
+
+    def in_flight(self):
+        with self._lock:
+            return sum(self._in_flight.values())
+
+    def fits(self, model):
+        """Whether recent performance of model is within the SLO and error budget."""
+        with self._lock:
+            stats = self._stats.get(model)
+            summary = stats.summary() if stats is not None else None
+        if summary is None or summary["count"] < MIN_SAMPLES:
+            return True
+        return summary["error_rate"] <= self.max_error_rate and summary["p95"] <= self.slo
+
+    def choose(self, user_input, available=None):
+        """
+        Pick the model for a request.
+
+        Args:
+            user_input (str): The user's message
+            available (callable): Optional check that a model's endpoint is up,
+                e.g. its circuit breaker
+
+        Returns:
+            str: A MODELS key
+        """
+        text = user_input.strip()
+        if len(text) < SHORT_INPUT_CHARS or self.in_flight() >= self.load_limit:
+            return SMALL_MODEL
+        non_ascii = sum(not char.isascii() for char in text)
+        preference = MULTILINGUAL_PREFERENCE if non_ascii > len(text) / 4 else ENGLISH_PREFERENCE
+        for model in preference[:-1]:
+            if (available is None or available(model)) and self.fits(model):
+                return model
+        return SMALL_MODEL
+
+    def stats(self):
+        with self._lock:
+            return {model: {**stats.summary(), "in_flight": self._in_flight.get(model, 0)}
+                    for model, stats in self._stats.items()}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the process-wide router, shared by all sessions."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
@@ -0,0 +1,284 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils import metrics, resilience
+from utils.chatbot import get_bot_response, stream_bot_response
+from utils.speech_processing import synthesize_speech_bytes, transcribe_audio
+
+DEFAULT_MODEL = "google/flan-t5-small"
+
+# Stage order; a turn enters at the first stage it has input for
+STAGES = ("stt", "llm", "tts")
+
+
+class Turn:
+    """
+    One request travelling through the pipeline.
+
+    A turn starts at speech-to-text if it has audio, at the chat model if it
+    has user_input, or at text-to-speech if it only has bot_response. Each
+    stage fills in the next field; timings records seconds spent per stage,
+    and trace collects the finer-grained metrics recorded while it ran.
+    Endpoint retries in every stage share one deadline, so a cold model
+    can't stretch a turn past resilience.TURN_DEADLINE.
+
+    With stream=True the chat model's reply is also put on chunks, a
+    thread-safe queue, piece by piece as it is generated; None follows the
+    last piece once the turn is done, however it ended.
+    """
+
+    def __init__(self, future, audio=None, user_input=None, bot_response=None,
+                 model=DEFAULT_MODEL, hedge=False, synthesize=False, respond=True, memory=None,
+                 trace=None, deadline=None, stream=False):
+        self.future = future
+        # A trace passed in by the caller is finished (logged) by the caller
+        self.owns_trace = trace is None
+        self.trace = trace or metrics.TurnTrace()
+        self.audio = audio
+        self.user_input = user_input
+        self.bot_response = bot_response
+        self.speech = None
+        self.model = model
+        self.hedge = hedge
+        self.synthesize = synthesize
+        self.respond = respond
+        self.memory = memory
+        self.timings = {}
+        self.deadline = time.monotonic() + (resilience.TURN_DEADLINE if deadline is None else deadline)
+        self.chunks = queue.Queue() if stream else None
+        self._stream_ended = False
+
+    @property
+    def first_stage(self):
+        if self.audio is not None:
+            return "stt"
+        if self.user_input is not None:
+            return "llm"
+        return "tts"
+
+    @property
+    def cancelled(self):
+        return self.future.cancelled()
+
+    def cancel(self):
+        """Drop the turn; a stage already running finishes but its result is discarded."""
+        self.future.cancel()
+        self.end_stream()
+
+    def end_stream(self):
+        if self.chunks is not None and not self._stream_ended:
+            self._stream_ended = True
+            self.chunks.put(None)
+
+    def to_dict(self):
+        return {
+            "user_input": self.user_input,
+            "bot_response": self.bot_response,
+            "speech_bytes": len(self.speech) if self.speech else 0,
+            "timings": dict(self.timings),
+            "trace": self.trace.to_dict(),
+        }
+
+
+class VoicePipeline:
+    """
+    Asyncio voice pipeline: speech-to-text, chat model and text-to-speech stages
+    joined by bounded queues.
+
+    Each stage runs a fixed number of workers, which is its concurrency limit;
+    the blocking HTTP calls run on a thread pool sized to match. A full queue
+    makes submit() wait, so bursts back up at the entrance instead of piling
+    work onto the inference endpoints. Turns from different sessions overlap:
+    one can be in STT while another is waiting on the chat model.
+    """
+
+    def __init__(self, stt_concurrency=2, llm_concurrency=4, tts_concurrency=2, queue_size=32):
+        self.concurrency = {"stt": stt_concurrency, "llm": llm_concurrency, "tts": tts_concurrency}
+        self.queue_size = queue_size
+        self._queues = {}
+        self._workers = []
+        self._executor = None
+
+    async def start(self):
+        if self._workers:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=sum(self.concurrency.values()),
+                                            thread_name_prefix="pipeline")
+        for stage in STAGES:
+            self._queues[stage] = asyncio.Queue(maxsize=self.queue_size)
+            for _ in range(self.concurrency[stage]):
+                self._workers.append(asyncio.create_task(self._worker(stage)))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for queue in self._queues.values():
+            while not queue.empty():
+                queue.get_nowait().cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def submit(self, audio=None, user_input=None, bot_response=None, model=DEFAULT_MODEL,
+                     hedge=False, synthesize=False, respond=True, memory=None, trace=None, deadline=None,
+                     stream=False):
+        """
+        Queue a turn and return it without waiting for the result.
+
+        With respond=False an audio turn stops after speech-to-text, for
+        callers that stream the reply in a turn of its own (stream=True).
+        Pass a session's memory.ConversationMemory to give the chat model the
+        conversation so far.
+
+        Pass the trace from metrics.start_turn() to add stage timings to a turn
+        that began earlier, e.g. with microphone capture; the caller then calls
+        metrics.finish_turn() itself. Otherwise the pipeline creates a trace and
+        finishes it when the turn completes.
+
+        deadline is the seconds the turn may take, resilience.TURN_DEADLINE
+        by default. With stream=True the reply is streamed onto turn.chunks
+        as it is generated (see Turn), while the turn holds one of the chat
+        stage's workers like any other.
+        """
+        if audio is None and user_input is None and bot_response is None:
+            raise ValueError("A turn needs audio, user_input or bot_response")
+        turn = Turn(asyncio.get_running_loop().create_future(), audio=audio, user_input=user_input,
+                    bot_response=bot_response, model=model, hedge=hedge, synthesize=synthesize,
+                    respond=respond, memory=memory, trace=trace, deadline=deadline, stream=stream)
+        await self._queues[turn.first_stage].put(turn)
+        return turn
+
+    async def run_turn(self, **kwargs):
+        """Queue a turn and wait for it to finish; takes the same arguments as submit()."""
+        turn = await self.submit(**kwargs)
+        try:
+            return await turn.future
+        except asyncio.CancelledError:
+            turn.cancel()
+            raise
+
+    async def _call(self, turn, fn, *args, **kwargs):
+        def run():
+            with metrics.use_trace(turn.trace), resilience.deadline(turn.deadline - time.monotonic()):
+                return fn(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, run)
+
+    async def _run_stage(self, stage, turn):
+        """Run one stage for a turn and return the next stage, or None when the turn is done."""
+        if stage == "stt":
+            turn.user_input = await self._call(turn, transcribe_audio, turn.audio)
+            if not turn.user_input or not turn.user_input.strip() or not turn.respond:
+                return None
+            return "llm"
+        if stage == "llm":
+            if turn.chunks is not None:
+                turn.bot_response = await self._call(turn, self._stream_reply, turn)
+            else:
+                turn.bot_response = await self._call(turn, get_bot_response, turn.user_input,
+                                                     model=turn.model, hedge=turn.hedge, memory=turn.memory)
+            return "tts" if turn.synthesize else None
+        turn.speech = await self._call(turn, synthesize_speech_bytes, turn.bot_response)
+        return None
+
+    @staticmethod
+    def _stream_reply(turn):
+        reply = ""
+        for chunk in stream_bot_response(turn.user_input, model=turn.model, memory=turn.memory, hedge=turn.hedge):
+            if turn.cancelled:
+                break
+            reply += chunk
+            turn.chunks.put(chunk)
+        return reply.strip()
+
+    async def _worker(self, stage):
+        queue = self._queues[stage]
+        while True:
+            turn = await queue.get()
+            try:
+                if turn.cancelled:
+                    continue
+                started = time.perf_counter()
+                next_stage = await self._run_stage(stage, turn)
+                turn.timings[stage] = time.perf_counter() - started
+                if turn.cancelled:
+                    continue
+                if next_stage is None:
+                    if turn.owns_trace:
+                        metrics.finish_turn(turn.trace)
+                    turn.future.set_result(turn)
+                else:
+                    await self._queues[next_stage].put(turn)
+            except asyncio.CancelledError:
+                turn.cancel()
+                raise
+            except Exception as e:
+                print(f"Error in pipeline stage {stage}: {str(e)}")
+                if not turn.future.done():
+                    turn.future.set_exception(e)
+            finally:
+                queue.task_done()
+                if turn.future.done():
+                    turn.end_stream()
+
+
+class BackgroundPipeline:
+    """
+    A VoicePipeline running on its own event loop thread, for synchronous callers
+    such as the Streamlit script.
+    """
+
+    def __init__(self, **kwargs):
+        self.pipeline = VoicePipeline(**kwargs)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="pipeline-loop", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.pipeline.start(), self.loop).result()
+
+    def run_turn(self, timeout=None, **kwargs):
+        """
+        Run a turn to completion and return it; arguments are those of
+        VoicePipeline.submit(). Called inside resilience.deadline(), the turn
+        gets whatever is left of it.
+        """
+        # The loop thread doesn't see the caller's context, so pass its deadline along
+        kwargs.setdefault("deadline", resilience.remaining(resilience.TURN_DEADLINE))
+        future = asyncio.run_coroutine_threadsafe(self.pipeline.run_turn(**kwargs), self.loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stream_turn(self, **kwargs):
+        """
+        Run a turn with stream=True and yield the reply's pieces as they are
+        generated; arguments are those of VoicePipeline.submit(). The turn is
+        cancelled if the caller stops reading early.
+        """
+        kwargs.setdefault("deadline", resilience.remaining(resilience.TURN_DEADLINE))
+        turn = asyncio.run_coroutine_threadsafe(self.pipeline.submit(stream=True, **kwargs), self.loop).result()
+        try:
+            yield from iter(turn.chunks.get, None)
+        finally:
+            if not turn.future.done():
+                self.loop.call_soon_threadsafe(turn.cancel)
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def get_background_pipeline():
+    """Return the process-wide pipeline shared by all Streamlit sessions."""
+    global _background
+    if _background is None:
+        with _background_lock:
+            if _background is None:
+                _background = BackgroundPipeline()
+    return _background
@@ -0,0 +1,298 @@
+import io
+import os
+import queue
+import threading
+import time
+from collections import deque
+from utils import metrics
+
+_DONE = object()
+_pygame_lock = threading.Lock()
+
+
+def _pygame():
+    # pygame is imported by the playback threads rather than the page script,
+    # so importing this module doesn't pay for SDL
+    with _pygame_lock:
+        import pygame
+    return pygame
+
+
+def _load_sound(audio_bytes):
+    # SDL converts the clip to the mixer's sample rate and format on load
+    return _pygame().mixer.Sound(file=io.BytesIO(audio_bytes))
+
+
+class _FileChunks:
+    """A file played as a single chunk; with delete, removed once read or closed unread."""
+
+    def __init__(self, path, delete):
+        self.path = path
+        self.delete = delete
+
+    def __iter__(self):
+        try:
+            with open(self.path, "rb") as f:
+                yield f.read()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.delete:
+            self.delete = False
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class _Item:
+    """One utterance: a stream of WAV chunks loaded into Sounds by a producer thread."""
+
+    def __init__(self, chunks, on_complete):
+        self.chunks = chunks
+        self.on_complete = on_complete
+        self.sounds = queue.Queue()
+        self.cancelled = threading.Event()
+        self.exhausted = False
+        self.created = time.perf_counter()
+        # Playback runs on another thread, so remember which turn this audio belongs to
+        self.trace = metrics.current_trace()
+        self.metrics = {"time_to_first_audio": None, "chunks": 0, "interrupted": False}
+
+    def start(self):
+        threading.Thread(target=self._produce, name="playback-producer", daemon=True).start()
+
+    def _produce(self):
+        with metrics.use_trace(self.trace):
+            self._load_chunks()
+
+    def _load_chunks(self):
+        pygame = _pygame()
+        try:
+            for audio in self.chunks:
+                if self.cancelled.is_set():
+                    break
+                try:
+                    self.sounds.put(_load_sound(audio))
+                except pygame.error as e:
+                    print(f"Error loading audio chunk: {str(e)}")
+        except Exception as e:
+            print(f"Error producing audio chunk: {str(e)}")
+        finally:
+            # Closing a generator runs its cleanup, e.g. cancelling in-flight TTS requests
+            close = getattr(self.chunks, "close", None)
+            if close:
+                close()
+            self.sounds.put(_DONE)
+
+    def cancel(self):
+        self.cancelled.set()
+        self.metrics["interrupted"] = True
+
+    def discard(self):
+        """Cancel an item that never started; its producer never ran, so close the chunks here."""
+        self.cancel()
+        close = getattr(self.chunks, "close", None)
+        if close:
+            try:
+                close()
+            except Exception as e:
+                print(f"Error discarding audio: {str(e)}")
+
+
+class PlaybackService:
+    """
+    Single-threaded audio playback engine.
+
+    All mixer calls happen on one worker thread that is driven by a command
+    queue, so callers never block on audio: play(), enqueue() and stop() return
+    immediately and status() reads a snapshot. Sources can be WAV bytes, a file
+    path (deleted after playback when delete=True) or an iterable of WAV chunks
+    such as synthesize_speech_chunks(), which is consumed as it is produced.
+    """
+
+    def __init__(self, tick=0.02):
+        self.tick = tick
+        self._commands = queue.Queue()
+        self._pending = deque()
+        self._current = None
+        self._channel = None
+        self._lock = threading.Lock()
+        # play/enqueue commands sent but not yet handled by the worker
+        self._unhandled = 0
+        self._status = {"playing": False, "queued": 0, "last_metrics": None, "error": None}
+        self._thread = threading.Thread(target=self._run, name="playback", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _as_chunks(source, delete):
+        if isinstance(source, (bytes, bytearray)):
+            return iter((bytes(source),))
+        if isinstance(source, str):
+            return _FileChunks(source, delete)
+        return source
+
+    def play(self, source, on_complete=None, delete=False):
+        """Stop whatever is playing, drop the queue and play source."""
+        self._submit("play", _Item(self._as_chunks(source, delete), on_complete))
+
+    def enqueue(self, source, on_complete=None, delete=False):
+        """Play source after everything already queued."""
+        self._submit("enqueue", _Item(self._as_chunks(source, delete), on_complete))
+
+    def stop(self):
+        """Stop playback immediately and cancel everything queued."""
+        self._commands.put(("stop", None))
+
+    def status(self):
+        """
+        Snapshot of playback state: playing, queued, metrics of the last
+        finished item, and error if the audio device couldn't be opened.
+        """
+        with self._lock:
+            return dict(self._status)
+
+    def is_playing(self):
+        return self.status()["playing"]
+
+    def _submit(self, command, item):
+        # Count the command until the worker handles it, so an immediate status() is accurate
+        with self._lock:
+            if self._status["error"] is None:
+                self._unhandled += 1
+                self._status["playing"] = True
+        self._commands.put((command, item))
+
+    def _publish(self, handled=0):
+        with self._lock:
+            self._unhandled = max(0, self._unhandled - handled)
+            busy = self._current is not None or bool(self._pending) or self._unhandled > 0
+            self._status["playing"] = busy and self._status["error"] is None
+            self._status["queued"] = len(self._pending)
+
+    def _finish(self, item):
+        with self._lock:
+            self._status["last_metrics"] = dict(item.metrics)
+        if item.on_complete:
+            try:
+                item.on_complete(item.metrics)
+            except Exception as e:
+                print(f"Error in playback completion callback: {str(e)}")
+
+    def _stop_all(self):
+        if self._current is not None:
+            self._current.cancel()
+            self._channel.stop()
+            self._finish(self._current)
+            self._current = None
+        while self._pending:
+            item = self._pending.popleft()
+            item.discard()
+            self._finish(item)
+
+    def _handle(self, command, item):
+        if command == "play":
+            self._stop_all()
+            self._pending.append(item)
+        elif command == "enqueue":
+            self._pending.append(item)
+        elif command == "stop":
+            self._stop_all()
+
+    def _advance(self):
+        if self._current is None:
+            if not self._pending:
+                return
+            self._current = self._pending.popleft()
+            self._current.start()
+
+        item = self._current
+        channel = self._channel
+        # Channel.queue holds one pending sound; only pull the next chunk when that slot is free
+        if not item.exhausted and (not channel.get_busy() or channel.get_queue() is None):
+            try:
+                sound = item.sounds.get_nowait()
+            except queue.Empty:
+                sound = None
+            if sound is _DONE:
+                item.exhausted = True
+            elif sound is not None:
+                if channel.get_busy():
+                    channel.queue(sound)
+                else:
+                    channel.play(sound)
+                if item.metrics["time_to_first_audio"] is None:
+                    item.metrics["time_to_first_audio"] = time.perf_counter() - item.created
+                    print(f"Time to first audio: {item.metrics['time_to_first_audio']:.3f}s")
+                    metrics.observe("playback_start", item.metrics["time_to_first_audio"], trace=item.trace)
+                    metrics.log_event("playback_start", trace=item.trace,
+                                      seconds=round(item.metrics["time_to_first_audio"], 4))
+                item.metrics["chunks"] += 1
+
+        if item.exhausted and not channel.get_busy():
+            item.metrics["duration"] = time.perf_counter() - item.created
+            self._finish(item)
+            self._current = None
+
+    def _open_mixer(self):
+        try:
+            pygame = _pygame()
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            self._channel = pygame.mixer.Channel(0)
+            pygame.mixer.set_reserved(1)
+            return True
+        except Exception as e:
+            print(f"Audio playback disabled, the audio device couldn't be opened: {str(e)}")
+            with self._lock:
+                self._status["error"] = str(e)
+                self._status["playing"] = False
+                self._unhandled = 0
+            return False
+
+    def _drain(self):
+        # Without a device, drop every item as it arrives so temp files and TTS requests are cleaned up
+        while True:
+            _, item = self._commands.get()
+            if item is not None:
+                item.discard()
+                self._finish(item)
+
+    def _run(self):
+        if not self._open_mixer():
+            self._drain()
+        while True:
+            idle = self._current is None and not self._pending
+            handled = 0
+            try:
+                command, item = self._commands.get(timeout=None if idle else self.tick)
+                handled = command != "stop"
+                self._handle(command, item)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                print(f"Error handling playback command: {str(e)}")
+            try:
+                self._advance()
+            except Exception as e:
+                print(f"Error playing audio: {str(e)}")
+                if self._current is not None:
+                    self._current.cancel()
+                    self._finish(self._current)
+                    self._current = None
+            self._publish(handled)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_playback_service():
+    """Return the process-wide playback service; the mixer is shared by all sessions."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = PlaybackService()
+    return _service
@@ -0,0 +1,206 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+import requests
+
+# Statuses worth retrying; the inference API answers 503 while a model is loading
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "8"))
+
+# Budget for a whole pipeline turn, and for a call made outside any turn deadline
+TURN_DEADLINE = float(os.getenv("TURN_DEADLINE", "45"))
+DEFAULT_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "30"))
+
+# Consecutive failed calls before an endpoint's breaker opens, and how long it stays open
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+_deadline = contextvars.ContextVar("voicebot_deadline", default=None)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint breaker: after threshold consecutive failures calls fail fast
+    for cooldown seconds, then a single probe decides whether to close again.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        """Whether a call may go ahead; in half-open state only one probe is let through."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def available(self):
+        """Like allow() but without claiming the half-open probe."""
+        return self.state != "open"
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url):
+    with _breakers_lock:
+        if url not in _breakers:
+            _breakers[url] = CircuitBreaker()
+        return _breakers[url]
+
+
+def is_available(url):
+    """False while the endpoint's breaker is open, so callers can skip straight to a fallback."""
+    return get_breaker(url).available()
+
+
+@contextmanager
+def deadline(seconds):
+    """Bound every endpoint call in the block, including retries, to finish within seconds."""
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(current, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(default=DEFAULT_DEADLINE):
+    """Seconds left before the current deadline, or default outside one."""
+    at = _deadline.get()
+    if at is None:
+        return default
+    return max(0.0, at - time.monotonic())
+
+
+def retry_delay(response, attempt):
+    """
+    Seconds to wait before the next attempt.
+
+    Honors the API's estimated_time for loading models and Retry-After
+    headers; otherwise uses full-jitter exponential backoff.
+    """
+    if response is not None:
+        hint = None
+        if response.status_code == 503:
+            try:
+                hint = float(response.json().get("estimated_time"))
+            except (ValueError, TypeError, AttributeError):
+                hint = None
+        if hint is None:
+            try:
+                hint = float(response.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                hint = None
+        if hint is not None:
+            return hint + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def call(url, send, max_attempts=MAX_ATTEMPTS):
+    """
+    Call an endpoint with retries, backoff and its circuit breaker.
+
+    Attempts and the waits between them stay within the current deadline();
+    outside one, the call gets DEFAULT_DEADLINE seconds of its own.
+
+    Args:
+        url (str): Endpoint URL, which selects the breaker
+        send (callable): Makes one attempt; called with the seconds left in the
+            deadline and returns a requests.Response
+        max_attempts (int): Upper bound on attempts within the deadline
+
+    Returns:
+        requests.Response: The first non-retryable response, or the last
+            retryable one if attempts or the deadline ran out
+
+    Raises:
+        CircuitOpenError: If the endpoint's breaker is open
+        requests.exceptions.RequestException: If every attempt failed to connect
+    """
+    if _deadline.get() is None:
+        with deadline(DEFAULT_DEADLINE):
+            return call(url, send, max_attempts)
+
+    breaker = get_breaker(url)
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit open for {url}")
+
+    # Anything but a non-retryable response counts against the breaker, including
+    # unexpected exceptions, so a half-open probe is always resolved
+    succeeded = False
+    try:
+        response = None
+        error = None
+        for attempt in range(max_attempts):
+            time_left = remaining()
+            try:
+                response = send(time_left)
+                error = None
+            except requests.exceptions.RequestException as e:
+                response = None
+                error = e
+            if response is not None and response.status_code not in RETRYABLE_STATUS:
+                succeeded = True
+                return response
+
+            delay = retry_delay(response, attempt)
+            if attempt == max_attempts - 1 or delay >= remaining():
+                break
+            if response is not None:
+                # Release the connection of a streamed response that won't be read
+                response.close()
+            status = response.status_code if response is not None else type(error).__name__
+            print(f"Retrying {url} in {delay:.2f}s after {status} (attempt {attempt + 1}/{max_attempts})")
+            time.sleep(delay)
+
+        if response is not None:
+            return response
+        raise error
+    finally:
+        if succeeded:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
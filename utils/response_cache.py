@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "512"))
+TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 60 * 60)))
+# Set RESPONSE_CACHE_DB to a file path to share cached replies across processes and restarts
+DB_PATH = os.getenv("RESPONSE_CACHE_DB")
+DB_MAX_ROWS = int(os.getenv("RESPONSE_CACHE_DB_ROWS", "50000"))
+
+_WHITESPACE = re.compile(r"\s+")
+_WORD = re.compile(r"[a-z']+")
+
+# Words that point back at earlier turns; an input containing one is treated as a follow-up
+FOLLOW_UP_WORDS = frozenset("""
+    it its this that these those they them their he him his she her
+    more else again also too same other another previous earlier above said mentioned
+""".split())
+
+
+def normalize_input(text):
+    """Fold case, whitespace and trailing punctuation so trivially different phrasings share a key."""
+    return _WHITESPACE.sub(" ", text).strip().lower().rstrip(".!?")
+
+
+def is_follow_up(user_input):
+    """Whether the input seems to refer back to the conversation, e.g. "tell me more" or "why is that"."""
+    return any(word in FOLLOW_UP_WORDS for word in _WORD.findall(user_input.lower()))
+
+
+def cache_key(model, user_input, parameters, context=""):
+    key = [model, normalize_input(user_input), parameters]
+    if context:
+        # Only the prompt context the reply depends on is passed in: see chatbot._prepare
+        key.append(context)
+    payload = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache of chatbot replies keyed by model, normalized input and generation parameters.
+
+    The key also covers the prompt context the reply depends on: the
+    knowledge passages, and for follow-ups the earlier turns as well, so
+    only a self-contained question can hit in another conversation. The
+    follow_ups counter shows how many lookups were keyed on a conversation.
+
+    Lookups hit an in-process LRU first and fall back to an optional SQLite
+    table. Both tiers expire entries after ttl seconds and evict the least
+    recently used entries beyond their size limits.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, db_path=DB_PATH, db_max_rows=DB_MAX_ROWS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_max_rows = db_max_rows
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "memory_hits": 0, "db_hits": 0, "misses": 0, "bypassed": 0,
+                          "follow_ups": 0}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.commit()
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, model, user_input, parameters, context=""):
+        """Return the cached reply, or None on a miss."""
+        key = cache_key(model, user_input, parameters, context)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, created = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self._counters["hits"] += 1
+                    self._counters["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    response, created = row
+                    if not self._expired(created, now):
+                        self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, response, created)
+                        self._counters["hits"] += 1
+                        self._counters["db_hits"] += 1
+                        return response
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self._counters["misses"] += 1
+            return None
+
+    def _remember(self, key, response, created):
+        self._memory[key] = (response, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def put(self, model, user_input, parameters, response, context=""):
+        """Store a reply in both tiers."""
+        key = cache_key(model, user_input, parameters, context)
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, response, now, now),
+                )
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.db_max_rows,),
+                )
+                self._db.commit()
+
+    def record_bypass(self):
+        with self._lock:
+            self._counters["bypassed"] += 1
+
+    def record_follow_up(self):
+        with self._lock:
+            self._counters["follow_ups"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        """Hit/miss counters and current sizes, for tuning the limits."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            if self._db is not None:
+                stats["db_entries"] = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide response cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -1,12 +1,73 @@
-import fitz  # PyMuPDF
+import hashlib
+import os
+import threading
+
+# Extracted text by sha256 of the PDF, and the last seen (mtime, size, sha256) per path
+_texts = {}
+_files = {}
+_lock = threading.Lock()
+
+
+def file_digest(path):
+    """sha256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _current_digest(path):
+    # Re-hash only when the file's mtime or size changed since it was last seen
+    stat = os.stat(path)
+    with _lock:
+        known = _files.get(path)
+    if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+        return known[2]
+    digest = file_digest(path)
+    with _lock:
+        _files[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def iter_pages(pdf_path):
+    """
+    Yield the text of each page of a PDF in order, one page in memory at a time.
+
+    Raises:
+        RuntimeError: If PyMuPDF can't open or parse the file
+    """
+    import fitz  # PyMuPDF, loaded on first parse
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            yield page.get_text()
+
+
+def extract_text(pdf_path):
+    """
+    Text of a PDF and the sha256 it was extracted from.
+
+    Each version of a file is parsed once; later calls return the cached
+    text until the file's mtime or size changes and its hash with it.
+
+    Raises:
+        OSError: If the file can't be read
+        RuntimeError: If PyMuPDF can't parse it
+    """
+    digest = _current_digest(os.path.abspath(pdf_path))
+    with _lock:
+        text = _texts.get(digest)
+    if text is None:
+        text = "".join(iter_pages(pdf_path)).strip()
+        with _lock:
+            _texts[digest] = text
+    return text, digest
+
 
 def get_resume_text(pdf_path):
     """Extract text from a resume PDF file."""
-    text = ""
     try:
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                text += page.get_text()
+        text, _ = extract_text(pdf_path)
     except Exception as e:
         return f"Error reading resume: {str(e)}"
-    return text.strip()
+    return text
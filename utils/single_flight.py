@@ -0,0 +1,84 @@
+import hashlib
+import threading
+from concurrent.futures import Future
+
+
+def payload_key(url, **payload):
+    """Key identifying a request: the endpoint plus a sha256 of its payload."""
+    digest = hashlib.sha256()
+    _update(digest, payload)
+    return f"{url}#{digest.hexdigest()}"
+
+
+def _update(digest, value):
+    # Deterministic over dict order; bytes are hashed as-is rather than repr'd
+    if isinstance(value, bytes):
+        digest.update(b"b%d:" % len(value))
+        digest.update(value)
+    elif isinstance(value, str):
+        digest.update(b"s%d:" % len(value))
+        digest.update(value.encode("utf-8"))
+    elif isinstance(value, dict):
+        digest.update(b"d%d:" % len(value))
+        for key in sorted(value, key=str):
+            _update(digest, str(key))
+            _update(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(b"l%d:" % len(value))
+        for item in value:
+            _update(digest, item)
+    else:
+        _update(digest, repr(value))
+
+
+class SingleFlight:
+    """
+    Collapses identical concurrent calls into one.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for the same result (or exception) instead of making
+    their own call. Nothing is kept once the call finishes, so this is not
+    a cache: a later identical call runs again.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn for key, or join the call already in flight for it.
+
+        Args:
+            key (str): Identity of the call, e.g. from payload_key()
+            fn (callable): Makes the call; takes no arguments
+            timeout (float): Seconds a joining caller waits for the result
+
+        Returns:
+            tuple: (result, shared), where shared is True if the result came
+                from another caller's call
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result(timeout), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
@@ -1,29 +1,66 @@
-import sounddevice as sd
 import numpy as np
-import scipy.io.wavfile as wav
 import tempfile
+import contextvars
+import queue
+from collections import deque
+import re
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import os
+import threading
 import time
-from dotenv import load_dotenv
-import streamlit as st
+from utils import audio_encoding, http_client, metrics, tts_cache
+from utils.vad import EnergyVAD, frame_size, trim_silence
 
-load_dotenv()
-HF_API_KEY = os.getenv("HF_API_KEY")
-HEADERS = {"Authorization": f"Bearer {HF_API_KEY}"}
+STT_URL = f"{http_client.HF_API_BASE}/models/openai/whisper-tiny"
+TTS_URL = f"{http_client.HF_API_BASE}/models/facebook/mms-tts-eng"
 
-STT_URL = "https://api-inference.huggingface.co/models/openai/whisper-tiny"
-TTS_URL = "https://api-inference.huggingface.co/models/facebook/mms-tts-eng"
+# Speech-to-text upload format, one of audio_encoding.UPLOAD_FORMATS
+STT_UPLOAD_FORMAT = os.getenv("STT_UPLOAD_FORMAT", "flac16k")
 
+# Set KEEP_AUDIO=1 to also write each recording to a temp WAV for debugging
+KEEP_AUDIO = os.getenv("KEEP_AUDIO", "0") == "1"
+
+# Sentence chunks synthesized concurrently when streaming speech
+TTS_MAX_WORKERS = int(os.getenv("TTS_MAX_WORKERS", "3"))
+
+http_client.register_endpoint(STT_URL)
+http_client.register_endpoint(TTS_URL, TTS_MAX_WORKERS * 2)
+
+# sounddevice and the device list are loaded on first recording, so text-only
+# sessions never load PortAudio or enumerate devices
+_sounddevice = None
+_input_devices = None
+_sounddevice_lock = threading.Lock()
+
+def get_sounddevice():
+    """Import sounddevice once per process; raises OSError if PortAudio is missing."""
+    global _sounddevice
+    if _sounddevice is None:
+        with _sounddevice_lock:
+            if _sounddevice is None:
+                import sounddevice
+                _sounddevice = sounddevice
+    return _sounddevice
+
+def input_devices():
+    """The audio device list, queried once per process instead of on every recording."""
+    global _input_devices
+    if _input_devices is None:
+        _input_devices = get_sounddevice().query_devices()
+    return _input_devices
+
+@metrics.timed("capture")
 def record_audio(duration=5, samplerate=16000):
     """Record audio from the microphone."""
     try:
         # Print device info for debugging
         print("Available audio devices:")
-        print(sd.query_devices())
+        print(input_devices())
         
         # Use default device
         print(f"Recording {duration} seconds of audio...")
+        sd = get_sounddevice()
         audio = sd.rec(int(samplerate * duration), samplerate=samplerate, channels=1, dtype=np.int16)
         sd.wait()
         
@@ -37,9 +74,180 @@ def record_audio(duration=5, samplerate=16000):
         # Return some dummy audio data so the app doesn't crash
         return np.zeros((samplerate * duration,), dtype=np.int16), samplerate
 
+def _open_input_stream(samplerate, frames):
+    def callback(indata, frame_count, time_info, status):
+        if status:
+            print(f"Recording status: {status}")
+        frames.put(indata.copy())
+
+    return get_sounddevice().InputStream(samplerate=samplerate, channels=1, dtype=np.int16,
+                                         blocksize=frame_size(samplerate), callback=callback)
+
+def _capture_utterance(frames, vad, samplerate, chunks, heard_speech, max_duration,
+                       silence_duration, start_timeout):
+    """Pull frames into chunks until trailing silence, max_duration or start_timeout."""
+    recorded = sum(len(chunk) for chunk in chunks)
+    silent = 0
+    max_samples = int(samplerate * max_duration)
+    silence_samples = int(samplerate * silence_duration)
+    timeout_samples = int(samplerate * start_timeout)
+
+    while recorded < max_samples:
+        chunk = frames.get(timeout=1.0)
+        chunks.append(chunk)
+        recorded += len(chunk)
+        if vad.is_speech(chunk):
+            heard_speech = True
+            silent = 0
+        else:
+            silent += len(chunk)
+        if heard_speech and silent >= silence_samples:
+            break
+        if not heard_speech and recorded >= timeout_samples:
+            print("No speech detected, stopping recording")
+            break
+    return heard_speech
+
+def _finish_capture(chunks, heard_speech, samplerate, vad):
+    if not chunks:
+        return np.zeros((0, 1), dtype=np.int16), samplerate
+
+    audio = np.concatenate(chunks)
+    if heard_speech:
+        audio = trim_silence(audio, samplerate, vad)
+    print(f"Recorded {len(audio) / samplerate:.2f} seconds of audio")
+    return audio, samplerate
+
+@metrics.timed("capture")
+def record_until_silence(samplerate=16000, max_duration=15, silence_duration=0.8,
+                         start_timeout=5):
+    """
+    Record from the microphone until the speaker stops talking.
+
+    Frames arrive from a sounddevice.InputStream callback and are classified by
+    an energy/zero-crossing VAD. Recording ends once speech has been followed by
+    silence_duration seconds of silence, after max_duration seconds, or after
+    start_timeout seconds without any speech. Leading and trailing silence is
+    trimmed before the audio is returned.
+
+    Returns:
+        tuple: (audio, samplerate) with audio as an (n, 1) int16 array
+    """
+    frames = queue.Queue()
+    vad = EnergyVAD(samplerate)
+    chunks = []
+    heard_speech = False
+
+    try:
+        print(f"Recording until silence (max {max_duration} seconds)...")
+        with _open_input_stream(samplerate, frames):
+            heard_speech = _capture_utterance(frames, vad, samplerate, chunks, False, max_duration,
+                                              silence_duration, start_timeout)
+    except queue.Empty:
+        print("Error recording audio: no audio received from the input stream")
+    except Exception as e:
+        print(f"Error recording audio: {str(e)}")
+
+    return _finish_capture(chunks, heard_speech, samplerate, vad)
+
+def listen_for_barge_in(player, samplerate=16000, min_speech_ms=240, preroll_ms=300,
+                        max_duration=15, silence_duration=0.8, calibration_ms=300, stop=None):
+    """
+    Listen while the bot speaks and capture the user's reply if they interrupt.
+
+    The bot's own voice leaks into the microphone and would pass as speech,
+    so the first calibration_ms of frames only set the VAD's noise floor to
+    the echo level, and after that a frame counts as speech only well above
+    it (a stricter ratio than normal recording). Once min_speech_ms of
+    consecutive speech is heard, playback (and any TTS still in flight for
+    it) is stopped and the utterance is captured, including a short pre-roll
+    so the first syllable isn't lost.
+
+    Args:
+        player (PlaybackService): The service playing the bot's reply
+        stop (threading.Event): Stops listening when set, as if playback had
+            finished; an utterance already being captured is still finished
+
+    Returns:
+        tuple: (audio, samplerate) if the user barged in, or None if playback
+            finished without the user speaking
+    """
+    frames = queue.Queue()
+    monitor = EnergyVAD(samplerate, energy_ratio=6.0)
+    frame_ms = monitor.frame_ms
+    needed = max(1, min_speech_ms // frame_ms)
+    calibration_frames = calibration_ms // frame_ms
+    preroll = deque(maxlen=max(needed, preroll_ms // frame_ms))
+    streak = 0
+    chunks = []
+    heard_speech = False
+
+    try:
+        with _open_input_stream(samplerate, frames):
+            while player.is_playing() and not (stop is not None and stop.is_set()):
+                try:
+                    chunk = frames.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                preroll.append(chunk)
+                if calibration_frames > 0:
+                    calibration_frames -= 1
+                    monitor.calibrate(chunk)
+                    continue
+                streak = streak + 1 if monitor.is_speech(chunk) else 0
+                if streak >= needed:
+                    break
+            else:
+                return None
+
+            print("Barge-in detected, stopping playback")
+            player.stop()
+            chunks = list(preroll)
+            with metrics.timed("capture"):
+                heard_speech = _capture_utterance(frames, EnergyVAD(samplerate), samplerate, chunks, True,
+                                                  max_duration, silence_duration, start_timeout=max_duration)
+    except queue.Empty:
+        print("Error recording audio: no audio received from the input stream")
+    except Exception as e:
+        print(f"Error recording audio: {str(e)}")
+        if not chunks:
+            return None
+
+    return _finish_capture(chunks, heard_speech, samplerate, monitor)
+
+class BargeInMonitor:
+    """
+    listen_for_barge_in() on a background thread, so the Streamlit script
+    keeps handling clicks while the bot speaks.
+
+    The owner polls running() and, once it is False, takes captured: the
+    user's utterance, or None if playback ended or the monitor was stopped
+    without anyone speaking.
+    """
+
+    def __init__(self, player, trace=None, **options):
+        self.trace = trace
+        self.captured = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=metrics.context_with(trace).run, args=(self._listen, player, options),
+                                        name="barge-in", daemon=True)
+        self._thread.start()
+
+    def _listen(self, player, options):
+        self.captured = listen_for_barge_in(player, stop=self._stop, **options)
+
+    def running(self):
+        return self._thread.is_alive()
+
+    def stop(self, timeout=1.0):
+        """Stop listening and give the microphone back; an utterance being captured is still finished."""
+        self._stop.set()
+        self._thread.join(timeout)
+
 def save_audio(audio, samplerate):
     """Save the recorded audio to a temporary file."""
     try:
+        import scipy.io.wavfile as wav
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
         wav.write(temp_file.name, samplerate, audio)
         print(f"Audio saved to: {temp_file.name}")
@@ -48,33 +256,78 @@ def save_audio(audio, samplerate):
         print(f"Error saving audio: {str(e)}")
         return None
 
-def transcribe_audio(audio_path):
-    """Send audio to Hugging Face API for transcription."""
-    if not audio_path:
+@metrics.timed("encode")
+def encode_audio(audio, samplerate, keep_on_disk=None, fmt=None):
+    """
+    Encode recorded audio in memory for upload to speech-to-text.
+
+    Args:
+        audio (np.ndarray): Recorded int16 samples
+        samplerate (int): Sample rate of the recording
+        keep_on_disk (bool): Also write the encoded audio to a temp file for
+            debugging; defaults to the KEEP_AUDIO environment setting
+        fmt (str): Upload format; defaults to the STT_UPLOAD_FORMAT setting
+
+    Returns:
+        bytes: The encoded audio, or None if encoding failed
+    """
+    if keep_on_disk is None:
+        keep_on_disk = KEEP_AUDIO
+    try:
+        audio_bytes = audio_encoding.encode(audio, samplerate, fmt or STT_UPLOAD_FORMAT)
+    except Exception as e:
+        print(f"Error encoding audio: {str(e)}")
+        return None
+
+    if keep_on_disk:
+        try:
+            suffix = ".flac" if audio_encoding.content_type(audio_bytes) == "audio/flac" else ".wav"
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as f:
+                f.write(audio_bytes)
+            print(f"Audio kept for debugging at: {f.name}")
+        except OSError as e:
+            print(f"Error saving audio: {str(e)}")
+    return audio_bytes
+
+@metrics.timed("stt")
+def transcribe_audio(audio):
+    """
+    Send audio to Hugging Face API for transcription.
+
+    Args:
+        audio (bytes or str): Encoded WAV bytes, or the path of a WAV file
+
+    Returns:
+        str: The transcribed text, or an empty string on failure
+    """
+    if not audio:
         return ""
         
     try:
-        print(f"Sending audio file {audio_path} for transcription...")
+        if isinstance(audio, str):
+            with open(audio, "rb") as f:
+                audio_data = f.read()
+        else:
+            audio_data = audio
+        print(f"Sending {len(audio_data)} bytes of audio for transcription...")
         
-        with open(audio_path, "rb") as f:
-            audio_data = f.read()
+        # First try with multipart/form-data; both attempts share the same encoded bytes
+        mime_type = audio_encoding.content_type(audio_data)
+        filename = "audio.flac" if mime_type == "audio/flac" else "audio.wav"
+        response = http_client.post(
+            STT_URL, 
+            files={"file": (filename, audio_data, mime_type)}
+        )
         
-        # First try with multipart/form-data
-        with open(audio_path, "rb") as f:
-            response = requests.post(
-                STT_URL, 
-                headers=HEADERS, 
-                files={"file": f}
-            )
-        
-        # If first attempt fails, try with raw bytes
-        if response.status_code != 200:
+        # If the endpoint rejects the form upload, try with raw bytes; loading
+        # and overload errors were already retried with backoff by http_client
+        if 400 <= response.status_code < 500 and response.status_code != 429:
             print(f"First transcription attempt failed: {response.status_code} - {response.text}")
             print("Trying alternative transcription method...")
             
-            response = requests.post(
+            response = http_client.post(
                 STT_URL,
-                headers={**HEADERS, "Content-Type": "audio/wav"},
+                headers={"Content-Type": mime_type},
                 data=audio_data
             )
         
@@ -91,26 +344,168 @@ def transcribe_audio(audio_path):
         print(f"Error transcribing audio: {str(e)}")
         return ""
 
-def synthesize_speech(text):
-    """Convert text to speech using a valid Hugging Face API model."""
+def synthesize_speech_bytes(text):
+    """
+    Return synthesized WAV bytes for text, serving repeats from the TTS cache.
+
+    Runs on TTS pool threads and in the headless server as well as in the
+    Streamlit script, so failures are logged and None is returned; callers
+    that have a page to show them on do so.
+    """
+    cache = tts_cache.get_cache()
+    audio = cache.get(text, TTS_URL)
+    metrics.cache_event("tts", audio is not None)
+    if audio is not None:
+        print(f"TTS cache hit for text: '{text}'")
+        return audio
+
     try:
         print(f"Synthesizing speech for text: '{text}'")
-        response = requests.post(TTS_URL, headers=HEADERS, json={"inputs": text})
+        with metrics.timed("tts"):
+            response = http_client.post(TTS_URL, json={"inputs": text})
 
         if response.status_code != 200:
-            st.error(f"TTS API Error: {response.status_code} - {response.text}")
             print(f"TTS API Error: {response.status_code} - {response.text}")
             return None
 
-        # Save audio file correctly
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-        with open(temp_file.name, "wb") as f:
-            f.write(response.content)  # Write raw audio bytes
-        
-        print(f"Speech synthesized and saved to: {temp_file.name}")
-        return temp_file.name  # Return saved file path
+        audio = response.content  # Raw audio bytes
+        cache.put(text, TTS_URL, audio)
+        return audio
 
     except requests.exceptions.RequestException as e:
-        st.error(f"TTS request failed: {str(e)}")
         print(f"TTS request failed: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+def synthesize_speech(text):
+    """
+    Convert text to speech and return the path of the WAV file.
+
+    The file lives in the TTS cache directory, which is size-bounded and
+    evicted by the cache, so callers must not delete it.
+    """
+    cache = tts_cache.get_cache()
+    path = cache.get_path(text, TTS_URL)
+    if path:
+        print(f"TTS cache hit for text: '{text}'")
+        return path
+
+    audio = synthesize_speech_bytes(text)
+    if audio is None:
+        return None
+
+    path = cache.get_path(text, TTS_URL) or cache.put(text, TTS_URL, audio)
+    print(f"Speech synthesized and saved to: {path}")
+    return path
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+def split_sentences(text, min_chars=20):
+    """
+    Split text into sentence-sized chunks for streaming synthesis.
+
+    Fragments shorter than min_chars are merged into the following sentence
+    so that a reply like "Sure. Here it is." costs one request, not two.
+    """
+    chunks = []
+    pending = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        pending = f"{pending} {sentence}".strip() if pending else sentence.strip()
+        if len(pending) >= min_chars:
+            chunks.append(pending)
+            pending = ""
+    if pending:
+        if chunks and len(pending) < min_chars:
+            chunks[-1] = f"{chunks[-1]} {pending}"
+        else:
+            chunks.append(pending)
+    return chunks
+
+def stream_sentences(chunks, min_chars=20):
+    """
+    Group a stream of text chunks, e.g. generated tokens, into sentences.
+
+    Each sentence is yielded as soon as the text after it starts, with the
+    same merging of short fragments as split_sentences(); whatever is left
+    when the chunks run out is yielded last.
+    """
+    buffer = ""
+    pending = ""
+    for chunk in chunks:
+        buffer += chunk
+        parts = _SENTENCE_END.split(buffer)
+        # The last part may be an unfinished sentence
+        buffer = parts.pop()
+        for sentence in parts:
+            pending = f"{pending} {sentence}".strip() if pending else sentence.strip()
+            if len(pending) >= min_chars:
+                yield pending
+                pending = ""
+    tail = f"{pending} {buffer.strip()}".strip()
+    if tail:
+        yield tail
+
+def synthesize_speech_chunks(text, max_workers=None):
+    """
+    Synthesize text sentence by sentence, yielding WAV bytes in order.
+
+    Up to max_workers sentences are synthesized concurrently, so the first
+    chunk is available as soon as its own request finishes while later ones
+    are still in flight. Chunks that fail to synthesize are skipped.
+    """
+    return synthesize_sentence_stream(split_sentences(text), max_workers)
+
+def synthesize_sentence_stream(sentences, max_workers=None):
+    """
+    Synthesize sentences as they arrive, yielding WAV bytes in order.
+
+    sentences may be a slow iterator, such as stream_sentences() over a
+    reply that is still being generated: a feeder thread pulls from it and
+    starts synthesis of each sentence right away, keeping at most
+    max_workers requests ahead of playback.
+    """
+    max_workers = max_workers or TTS_MAX_WORKERS
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+    # Futures in sentence order; the bound keeps the feeder max_workers ahead
+    futures = queue.Queue(maxsize=max_workers)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up once the consumer has stopped, instead of blocking on a full queue
+        while not stopped.is_set():
+            try:
+                futures.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def feed():
+        try:
+            for sentence in sentences:
+                if stopped.is_set():
+                    return
+                # Run in a copy of this context so the turn's trace sees each request
+                future = pool.submit(contextvars.copy_context().run, synthesize_speech_bytes, sentence)
+                if not put(future):
+                    return
+        except Exception as e:
+            print(f"Error reading sentences to synthesize: {str(e)}")
+        finally:
+            put(done)
+
+    feeder = threading.Thread(target=contextvars.copy_context().run, args=(feed,),
+                              name="tts-feeder", daemon=True)
+    feeder.start()
+    try:
+        while True:
+            future = futures.get()
+            if future is done:
+                return
+            audio = future.result()
+            if audio:
+                yield audio
+    finally:
+        # When playback is interrupted, drop queued sentences without waiting on running requests
+        stopped.set()
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "myvoicebot_tts"))
+MEMORY_LIMIT_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(16 * 1024 * 1024)))
+DISK_LIMIT_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+
+
+def cache_key(text, voice):
+    """Content address for a synthesized clip: the same text and voice always map to the same key."""
+    return hashlib.sha256(f"{voice}\n{text}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    Two-tier cache of synthesized audio.
+
+    Clips live in an in-memory LRU bounded by total bytes, backed by a
+    directory of WAV files that is also bounded by bytes and evicted
+    least-recently-used first. The disk tier survives restarts, so
+    phrases like the canned error messages are only ever synthesized once.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, memory_limit=MEMORY_LIMIT_BYTES, disk_limit=DISK_LIMIT_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_disk_index()
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".wav"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len(".wav")], stat.st_size))
+        # Oldest first, so the front of the OrderedDict is the next eviction candidate
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _remember(self, key, audio):
+        if len(audio) > self.memory_limit:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _store(self, key, audio):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+        if key in self._disk:
+            self._disk_bytes -= self._disk.pop(key)
+        self._disk[key] = len(audio)
+        self._disk_bytes += len(audio)
+        while self._disk_bytes > self.disk_limit and len(self._disk) > 1:
+            evicted, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(evicted))
+            except OSError:
+                pass
+
+    def get(self, text, voice):
+        """Return cached audio bytes for (text, voice), or None on a miss."""
+        key = cache_key(text, voice)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                return self._memory[key]
+            if key not in self._disk:
+                return None
+            try:
+                with open(self._path(key), "rb") as f:
+                    audio = f.read()
+            except OSError:
+                self._disk_bytes -= self._disk.pop(key)
+                return None
+            self._disk.move_to_end(key)
+            self._remember(key, audio)
+            return audio
+
+    def get_path(self, text, voice):
+        """Return the on-disk path of a cached clip, or None on a miss."""
+        key = cache_key(text, voice)
+        with self._lock:
+            if key not in self._disk or not os.path.exists(self._path(key)):
+                return None
+            self._disk.move_to_end(key)
+            return self._path(key)
+
+    def put(self, text, voice, audio):
+        """Store audio bytes for (text, voice) in both tiers and return the on-disk path."""
+        key = cache_key(text, voice)
+        with self._lock:
+            self._remember(key, audio)
+            try:
+                self._store(key, audio)
+            except OSError as e:
+                print(f"Error writing TTS cache entry: {str(e)}")
+                return None
+            return self._path(key)
+
+    def stats(self):
+        """Entry counts and byte totals for both tiers."""
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide TTS cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AudioCache()
+    return _cache
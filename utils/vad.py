@@ -0,0 +1,115 @@
+import numpy as np
+
+FRAME_MS = 30
+
+
+def frame_size(samplerate, frame_ms=FRAME_MS):
+    """Number of samples in one analysis frame."""
+    return int(samplerate * frame_ms / 1000)
+
+
+def _as_float(audio):
+    audio = np.asarray(audio)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    if audio.dtype == np.int16:
+        return audio.astype(np.float32) / 32768.0
+    return audio.astype(np.float32, copy=False)
+
+
+def frame_features(audio, samplerate, frame_ms=FRAME_MS):
+    """
+    Compute per-frame RMS energy and zero-crossing rate.
+
+    Args:
+        audio (np.ndarray): int16 or float samples, mono or (n, channels)
+        samplerate (int): Sample rate of the audio
+        frame_ms (int): Frame length in milliseconds
+
+    Returns:
+        tuple: (rms, zcr) arrays with one value per complete frame
+    """
+    samples = _as_float(audio)
+    size = frame_size(samplerate, frame_ms)
+    count = len(samples) // size
+    if count == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    frames = samples[:count * size].reshape(count, size)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / float(size)
+    return rms, zcr
+
+
+class EnergyVAD:
+    """
+    Frame-level voice activity detector using energy and zero-crossing rate.
+
+    The noise floor adapts to frames classified as silence, so the detector
+    works with both quiet and noisy microphones without manual tuning.
+    """
+
+    def __init__(self, samplerate, frame_ms=FRAME_MS, energy_ratio=3.0, min_energy=0.005,
+                 max_zcr=0.35):
+        self.samplerate = samplerate
+        self.frame_ms = frame_ms
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        # Broadband noise (hiss, fans) crosses zero far more often than voiced speech
+        self.max_zcr = max_zcr
+        self.noise_floor = None
+        self._calibrated = 0
+
+    def threshold(self):
+        floor = self.noise_floor if self.noise_floor is not None else self.min_energy
+        return max(self.min_energy, floor * self.energy_ratio)
+
+    def calibrate(self, frame):
+        """
+        Fold a frame into the noise floor whatever it contains.
+
+        For steady background that would itself pass as speech, such as the
+        bot's own voice leaking into the microphone; the floor becomes the
+        mean level of the calibrated frames.
+        """
+        rms, _ = frame_features(frame, self.samplerate, self.frame_ms)
+        if len(rms) == 0:
+            return
+        self._calibrated += 1
+        level = float(rms.mean())
+        if self.noise_floor is None:
+            self.noise_floor = level
+        else:
+            self.noise_floor += (level - self.noise_floor) / self._calibrated
+
+    def is_speech(self, frame):
+        """Classify one frame of samples as speech (True) or silence (False)."""
+        rms, zcr = frame_features(frame, self.samplerate, self.frame_ms)
+        if len(rms) == 0:
+            return False
+        speech = bool(np.any((rms > self.threshold()) & (zcr < self.max_zcr)))
+        if not speech:
+            level = float(rms.mean())
+            if self.noise_floor is None:
+                self.noise_floor = level
+            else:
+                self.noise_floor = 0.95 * self.noise_floor + 0.05 * level
+        return speech
+
+
+def trim_silence(audio, samplerate, vad=None, padding_ms=150):
+    """
+    Drop leading and trailing silence, keeping a little padding around speech.
+
+    Returns the input unchanged if no speech is detected.
+    """
+    vad = vad or EnergyVAD(samplerate)
+    rms, zcr = frame_features(audio, samplerate, vad.frame_ms)
+    voiced = np.flatnonzero((rms > vad.threshold()) & (zcr < vad.max_zcr))
+    if len(voiced) == 0:
+        return audio
+    size = frame_size(samplerate, vad.frame_ms)
+    pad = int(samplerate * padding_ms / 1000)
+    start = max(0, voiced[0] * size - pad)
+    end = min(len(audio), (voiced[-1] + 1) * size + pad)
+    return audio[start:end]
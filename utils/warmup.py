@@ -0,0 +1,179 @@
+import io
+import os
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from utils import http_client
+from utils.chatbot import MODELS
+from utils.speech_processing import STT_URL, TTS_URL
+
+# Seconds between keep-warm pings; 0 turns the periodic ping off
+KEEP_WARM_INTERVAL = float(os.getenv("KEEP_WARM_INTERVAL", "0"))
+# Keep-warm stops once no session has been active for this many seconds
+KEEP_WARM_IDLE = float(os.getenv("KEEP_WARM_IDLE", "900"))
+# A priming request may wait this long for the model to load
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "120"))
+# A model that answered within this many seconds isn't primed again on demand
+READY_TTL = 300
+# After a failed or still-loading prime, wait this long before the next, doubling
+# per consecutive failure up to READY_TTL; a model's estimated_time is used if longer
+RETRY_BACKOFF = 5.0
+
+STT = "stt"
+TTS = "tts"
+
+
+class WarmupService:
+    """
+    Sends cheap priming requests so models are loaded before a user needs them.
+
+    Targets are named endpoints with a tiny request payload. warm() primes
+    them on a small thread pool, skipping ones already warming or recently
+    ready; the inference API is asked to hold each request until the model
+    has loaded. With a keep-warm interval, targets that were warmed are
+    pinged again periodically while sessions are active (see touch()).
+    """
+
+    def __init__(self, interval=KEEP_WARM_INTERVAL, idle_after=KEEP_WARM_IDLE):
+        self.interval = interval
+        self.idle_after = idle_after
+        self._targets = {}
+        self._status = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="warmup")
+        self._last_activity = time.monotonic()
+        self._thread = None
+
+    def add_target(self, name, url, **request):
+        """Register an endpoint; request holds the requests kwargs of its priming call."""
+        with self._lock:
+            self._targets[name] = (url, request)
+            self._status.setdefault(name, {"state": "cold", "checked": None, "latency": None,
+                                           "estimated_time": None, "failures": 0})
+
+    def warm(self, *names, force=False):
+        """Prime the named targets (all of them if none are given) in the background."""
+        now = time.monotonic()
+        with self._lock:
+            for name in names or list(self._targets):
+                status = self._status[name]
+                if name in self._in_flight:
+                    continue
+                if (not force and status["checked"] is not None
+                        and now - status["checked"] < self._retry_after(status)):
+                    continue
+                # A keep-warm ping of a ready model doesn't make it look unavailable
+                if status["state"] != "ready":
+                    status["state"] = "warming"
+                self._in_flight.add(name)
+                self._pool.submit(self._prime, name)
+        self._ensure_keep_warm()
+
+    @staticmethod
+    def _retry_after(status):
+        """Seconds after a prime before warm() sends another one for the target."""
+        if status["state"] == "ready":
+            return READY_TTL
+        backoff = min(READY_TTL, RETRY_BACKOFF * 2 ** max(0, status["failures"] - 1))
+        return max(backoff, status["estimated_time"] or 0)
+
+    def touch(self):
+        """Mark a session as active, which keeps the keep-warm ping running."""
+        self._last_activity = time.monotonic()
+
+    def status(self, name):
+        with self._lock:
+            return dict(self._status[name])
+
+    def statuses(self):
+        with self._lock:
+            return {name: dict(status) for name, status in self._status.items()}
+
+    def is_ready(self, name):
+        return self.status(name)["state"] == "ready"
+
+    def _prime(self, name):
+        url, request = self._targets[name]
+        started = time.perf_counter()
+        try:
+            response = http_client.post(url, timeout=(http_client.CONNECT_TIMEOUT, WARMUP_TIMEOUT),
+                                        retry=False, **request)
+            state, estimated_time = "ready", None
+            if response.status_code == 503:
+                state = "loading"
+                try:
+                    estimated_time = response.json().get("estimated_time")
+                except ValueError:
+                    pass
+            elif response.status_code != 200:
+                state = "error"
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {str(e)}")
+            state, estimated_time = "error", None
+        latency = time.perf_counter() - started
+        with self._lock:
+            self._in_flight.discard(name)
+            failures = 0 if state == "ready" else self._status[name]["failures"] + 1
+            self._status[name] = {"state": state, "checked": time.monotonic(), "latency": round(latency, 3),
+                                  "estimated_time": estimated_time, "failures": failures}
+        print(f"Warm-up of {name}: {state} after {latency:.2f}s")
+
+    def _ensure_keep_warm(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._keep_warm, name="keep-warm", daemon=True)
+                self._thread.start()
+
+    def _keep_warm(self):
+        while True:
+            time.sleep(self.interval)
+            if time.monotonic() - self._last_activity > self.idle_after:
+                continue
+            with self._lock:
+                warmed = [name for name, status in self._status.items() if status["state"] != "cold"]
+            if warmed:
+                self.warm(*warmed, force=True)
+
+
+def _silence_upload():
+    # A tenth of a second of silence is enough to load the speech model; written
+    # with the wave module so registering targets doesn't import scipy
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(bytes(3200))
+    return buffer.getvalue()
+
+
+def default_targets(service):
+    """Register the chat models (by MODELS key) and the STT and TTS endpoints."""
+    for model, config in MODELS.items():
+        service.add_target(model, config["url"], json={
+            "inputs": "Hello",
+            "parameters": {"max_length": 8},
+            "options": {"wait_for_model": True},
+        })
+    service.add_target(STT, STT_URL, data=_silence_upload(),
+                       headers={"Content-Type": "audio/wav", "x-wait-for-model": "true"})
+    service.add_target(TTS, TTS_URL, json={"inputs": "Hi", "options": {"wait_for_model": True}})
+    return service
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_warmup_service():
+    """Return the process-wide warm-up service with the default targets registered."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = default_targets(WarmupService())
+    return _service